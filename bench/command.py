@@ -0,0 +1,97 @@
+"""
+Measure the BLE-to-CAN command path on a vcan interface: how long
+CANHandler.schedule blocks its caller (the D-Bus method thread in
+production), enqueue-to-send latency inside the scheduler, and
+write-to-wire latency as seen by a second socket on the same interface.
+
+Each write carries the writer's monotonic clock in microseconds as its
+value. Every --safety-every'th write is sent at SAFETY priority over a
+background of BULK writes to --keys distinct keys, to show safety
+commands overtaking queued bulk traffic.
+
+    sudo ip link add dev vcan0 type vcan && sudo ip link set vcan0 up
+    python -m bench.command --interface vcan0 --writes 20000
+"""
+import argparse
+import threading
+import time
+
+import can
+
+from bench.common import now_us
+from canbus.handler import CANHandler
+from canbus.scheduler import SAFETY, BULK
+from canbus.tracing import Histogram
+
+CAN_ID = 0x123
+MODULE_ID = 0x12
+SAFETY_KEY = 0xFF
+
+
+def listen(interface, wire, stop):
+    bus = can.interface.Bus(interface, bustype='socketcan')
+    while not stop.is_set():
+        message = bus.recv(0.1)
+        if message is None:
+            continue
+        latency = (now_us() - int.from_bytes(message.data[2:6], 'big')) & 0xFFFFFFFF
+        wire[message.data[1] == SAFETY_KEY].record(latency * 1000)
+    bus.shutdown()
+
+
+def format_summary(histogram):
+    summary = histogram.summary()
+    return (f"n={summary['count']} p50 {summary['p50_us']:.0f} µs p99 {summary['p99_us']:.0f} µs "
+            f"max {summary['max_us']:.0f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--interface', default='vcan0')
+    parser.add_argument('--writes', type=int, default=20000)
+    parser.add_argument('--keys', type=int, default=32)
+    parser.add_argument('--safety-every', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=5000, help="writes per second")
+    args = parser.parse_args()
+
+    handler = CANHandler(args.interface, can_id=CAN_ID, module_id=MODULE_ID)
+    # Index 1 collects safety writes, index 0 everything else.
+    wire = [Histogram(), Histogram()]
+    stop = threading.Event()
+    listener = threading.Thread(target=listen, args=(args.interface, wire, stop))
+    listener.start()
+    time.sleep(0.1)
+
+    enqueue = Histogram()
+    interval = 1 / args.rate
+    deadline = time.perf_counter()
+    for i in range(args.writes):
+        if i % args.safety_every == 0:
+            key, priority = SAFETY_KEY, SAFETY
+        else:
+            key, priority = i % args.keys, BULK
+        start = time.monotonic_ns()
+        handler.schedule(key, start // 1000 & 0xFFFFFFFF, priority)
+        enqueue.record(time.monotonic_ns() - start)
+        deadline += interval
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    time.sleep(0.5)
+    stop.set()
+    listener.join()
+    stats = handler.scheduler.stats()
+    handler.stop()
+    handler.bus.shutdown()
+
+    print(f"schedule() call:     {format_summary(enqueue)}")
+    print(f"enqueue to send:     {format_summary(handler.scheduler.latency)}")
+    print(f"write to wire, bulk: {format_summary(wire[0])}")
+    print(f"write to wire, safe: {format_summary(wire[1])}")
+    print(f"scheduler: queued {stats['queued']}, coalesced {stats['coalesced']}, sent {stats['sent']}, "
+          f"errors {stats['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Helpers shared by the benchmarks: timestamped values, a retrying frame
+sender and a counting subscriber.
+"""
+import asyncio
+import time
+
+import can
+
+CAN_ID = 0x123
+MODULE_ID = 0x12
+KEY = 0x01
+
+
+def now_us():
+    # Monotonic microseconds, wrapped to fit a frame's 4 byte value.
+    return time.monotonic_ns() // 1000 & 0xFFFFFFFF
+
+
+def send_retrying(bus, message):
+    # Wait for room while the interface queue is full.
+    while True:
+        try:
+            bus.send(message)
+            return
+        except can.CanError:
+            time.sleep(0.0001)
+
+
+def send_frames(interface, frames, timestamped=False):
+    """
+    Send the given number of module/key/value frames on a socketcan interface,
+    returning that count. With timestamped, each value is now_us() at send
+    time, so subscribers can measure latency; otherwise it is 1.
+    """
+    bus = can.interface.Bus(interface, bustype='socketcan')
+    message = can.Message(arbitration_id=CAN_ID, data=[MODULE_ID, KEY, 0, 0, 0, 1], is_extended_id=False)
+    for _ in range(frames):
+        if timestamped:
+            message = can.Message(arbitration_id=CAN_ID, data=[MODULE_ID, KEY, *now_us().to_bytes(4, 'big')],
+                                  is_extended_id=False)
+        send_retrying(bus, message)
+    bus.shutdown()
+    return frames
+
+
+class CountingSubscriber:
+    """
+    Counts delivered frames; done is set once expected frames have arrived.
+    """
+    def __init__(self, expected=None):
+        self.expected = expected
+        self.count = 0
+        self.done = asyncio.Event()
+
+    def notify_batch(self, frames):
+        self.count += len(frames)
+        if self.expected is not None and self.count >= self.expected:
+            self.done.set()
@@ -0,0 +1,319 @@
+"""
+End-to-end benchmark of the CAN-to-BLE pipeline, with results stored as
+JSON for comparison between commits.
+
+Synthetic frames are generated at a fixed rate over a weighted mix of CAN
+IDs, on vcan or python-can's in-process 'virtual' bus. They go through
+CANHandler to one subscriber per ID, which measures send-to-delivery
+latency from the timestamp each frame carries as its value. Unless --no-dbus
+is given, a private dbus-daemon with the stub BlueZ from bench.startup is
+started too, and CountService is registered on it and notifying, so the
+D-Bus emit path is part of the measurement.
+
+Reported: frames generated and delivered, throughput, end-to-end and
+per-stage (canbus.tracing) latency percentiles, RSS growth over the run,
+and pipeline CPU time per 1000 frames. The generator runs in a thread of
+the same process; its own CPU time is subtracted.
+
+    python -m bench.e2e --bus virtual --rate 2000 --duration 10 --output before.json
+    # ...change something...
+    python -m bench.e2e --bus virtual --rate 2000 --duration 10 --output after.json --compare before.json
+
+--compare exits with status 1 if any metric regresses by more than
+--tolerance.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import can
+
+from bench.common import now_us, send_retrying
+from canbus import tracing
+from canbus.handler import CANHandler
+from canbus.queues import DROP_NEWEST
+
+TICK = 0.001
+SCHEDULE_LENGTH = 4096
+# Metric path -> True if higher is better.
+COMPARED_METRICS = {
+    ("throughput_fps",): True,
+    ("latency", "p50_us"): False,
+    ("latency", "p99_us"): False,
+    ("cpu_ms_per_1k",): False,
+    ("rss_growth_kb",): False,
+}
+# RSS growth below this is noise, whatever the relative change.
+RSS_SLACK_KB = 1024
+
+
+def parse_mix(spec):
+    # "0x123:3,0x124:1" -> [(0x123, 3.0), (0x124, 1.0)]; weights default to 1.
+    mix = []
+    for entry in spec.split(","):
+        can_id, _, weight = entry.partition(":")
+        mix.append((int(can_id, 0), float(weight or 1)))
+    return mix
+
+
+def read_rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class FrameGenerator:
+    """
+    Sends frames at a fixed rate from its own thread. IDs follow the mix;
+    modules and keys cycle over the given counts. The schedule is drawn
+    once from a seeded RNG so runs are repeatable.
+    """
+    def __init__(self, bus, rate, mix, modules, keys, seed=0):
+        self.bus = bus
+        self.rate = rate
+        rng = random.Random(seed)
+        ids = rng.choices([can_id for can_id, _ in mix], [weight for _, weight in mix], k=SCHEDULE_LENGTH)
+        self.schedule = [(can_id, number % modules, number % keys) for number, can_id in enumerate(ids)]
+        self.sent = 0
+        self.cpu = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="frame-generator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _send(self, can_id, module_id, key):
+        send_retrying(self.bus, can.Message(arbitration_id=can_id, is_extended_id=can_id > 0x7FF,
+                                            data=[module_id, key, *now_us().to_bytes(4, 'big')]))
+
+    def _run(self):
+        cpu = time.thread_time()
+        schedule = self.schedule
+        per_tick = self.rate * TICK
+        due = 0.0
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            due += per_tick
+            while due >= 1:
+                self._send(*schedule[self.sent % SCHEDULE_LENGTH])
+                self.sent += 1
+                due -= 1
+            deadline += TICK
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.cpu = time.thread_time() - cpu
+
+
+class LatencySubscriber:
+    def __init__(self):
+        self.count = 0
+        self.latency = tracing.Histogram()
+
+    def notify_batch(self, frames):
+        now = now_us()
+        record = self.latency.record
+        for frame in frames:
+            record(((now - frame[3]) & 0xFFFFFFFF) * 1000)
+        self.count += len(frames)
+
+    def reset(self):
+        self.count = 0
+        self.latency.reset()
+
+
+async def register_count_service(handler, notify_rate):
+    from ble.ble_transceiver import CountAdvertisement, CountService
+    from ble.bletools import BleContext
+    from ble.notifier import NotificationScheduler
+    from ble.service import Application
+
+    context = BleContext()
+    app = Application(context)
+    service = CountService(0, handler, NotificationScheduler(max_rate=notify_rate), context)
+    app.add_service(service)
+    await context.register(app, CountAdvertisement(0, context))
+    # What BlueZ does when a central subscribes.
+    service.get_characteristics()[0].StartNotify()
+    return service
+
+
+async def run(args, mix):
+    handler = CANHandler(args.interface, bustype=args.bus)
+    subscribers = {}
+    for can_id, _ in mix:
+        subscribers[can_id] = LatencySubscriber()
+        handler.add_subscriber(subscribers[can_id], can_id=can_id, maxsize=args.queue_size, policy=DROP_NEWEST)
+
+    receiver = asyncio.create_task(handler.receive_can_message())
+    service = None
+    if not args.no_dbus:
+        service = await register_count_service(handler, args.notify_rate)
+
+    generator_bus = can.interface.Bus(args.interface, bustype=args.bus)
+    generator = FrameGenerator(generator_bus, args.rate, mix, args.modules, args.keys, args.seed)
+    tracing.tracer.enable()
+    generator.start()
+
+    # Counters restart after the warm-up so imports, caches and queue growth
+    # are not measured.
+    await asyncio.sleep(args.warmup)
+    tracing.tracer.reset()
+    for subscriber in subscribers.values():
+        subscriber.reset()
+    sent = generator.sent
+    rss = read_rss_kb()
+    cpu = time.process_time()
+    wall = time.perf_counter()
+
+    await asyncio.sleep(args.duration)
+    generator.stop()
+    wall = time.perf_counter() - wall
+    # Let queued frames reach the subscribers.
+    await asyncio.sleep(0.5)
+    cpu = time.process_time() - cpu
+    rss_end = read_rss_kb()
+
+    delivered = sum(subscriber.count for subscriber in subscribers.values())
+    latency = tracing.Histogram()
+    for subscriber in subscribers.values():
+        latency.merge(subscriber.latency)
+    # The generator's CPU over the measured part of the run, pro rata.
+    pipeline_cpu = cpu - generator.cpu * args.duration / (args.warmup + args.duration)
+
+    results = {
+        "generated": generator.sent - sent,
+        "delivered": delivered,
+        "throughput_fps": delivered / wall,
+        "latency": latency.summary(),
+        "stages": tracing.tracer.snapshot()["stages"],
+        "rss_start_kb": rss,
+        "rss_end_kb": rss_end,
+        "rss_growth_kb": rss_end - rss,
+        "cpu_ms_per_1k": 1e6 * pipeline_cpu / delivered if delivered else None,
+        "queues": {f"{can_id:#x}": handler.subscribers[subscriber].stats()
+                   for can_id, subscriber in subscribers.items()},
+        "bus_health": handler.bus_health(),
+    }
+    if service is not None:
+        results["notifier"] = service.notifier.stats()
+
+    tracing.tracer.disable()
+    handler.stop()
+    await receiver
+    handler.bus.shutdown()
+    generator_bus.shutdown()
+    return results
+
+
+def lookup(results, path):
+    for name in path:
+        if not isinstance(results, dict) or name not in results:
+            return None
+        results = results[name]
+    return results
+
+
+def compare(baseline, results, tolerance):
+    """
+    Print each compared metric against the baseline and return the names
+    of those that got worse by more than tolerance.
+    """
+    regressions = []
+    for path, higher_is_better in COMPARED_METRICS.items():
+        name = ".".join(path)
+        before, after = lookup(baseline, path), lookup(results, path)
+        if before is None or after is None:
+            print(f"{name:>20}: not comparable")
+            continue
+        change = (after - before) / before if before else 0.0
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        if path == ("rss_growth_kb",) and after <= RSS_SLACK_KB:
+            worse = False
+        print(f"{name:>20}: {before:12.2f} -> {after:12.2f} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bus', choices=("virtual", "socketcan"), default="virtual",
+                        help="'socketcan' needs --interface to be up, e.g. vcan0")
+    parser.add_argument('--interface', default=None, help="default: vcan0, or 'bench' on the virtual bus")
+    parser.add_argument('--rate', type=float, default=2000, help="frames per second")
+    parser.add_argument('--duration', type=float, default=10.0, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--ids', default="0x123:4,0x124:2,0x200:1", help="CAN ID mix as id:weight,...")
+    parser.add_argument('--modules', type=int, default=4)
+    parser.add_argument('--keys', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queue-size', type=int, default=1024)
+    parser.add_argument('--notify-rate', type=float, default=10)
+    parser.add_argument('--no-dbus', action='store_true', help="skip the private D-Bus and CountService")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="allowed relative regression")
+    args = parser.parse_args()
+    if args.interface is None:
+        args.interface = "bench" if args.bus == "virtual" else "vcan0"
+    mix = parse_mix(args.ids)
+
+    if args.no_dbus:
+        results = asyncio.run(run(args, mix))
+    else:
+        from ble import mainloop
+        from bench.startup import start_private_bus, stop_private_bus
+
+        with tempfile.TemporaryDirectory() as directory:
+            daemon, stub, address = start_private_bus(directory)
+            os.environ["DBUS_SYSTEM_BUS_ADDRESS"] = address
+            try:
+                results = mainloop.run(run(args, mix))
+            finally:
+                stop_private_bus(daemon, stub)
+
+    report = {
+        "commit": current_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "results": results,
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {baseline.get('commit')} ({args.compare}):")
+        if compare(baseline["results"], results, args.tolerance):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Count how many frames reach Python on a vcan interface with and without the
+module filter installed by CANHandler.set_filters.
+
+    python -m bench.filters --interface vcan0 --frames 10000 --modules 16
+"""
+import argparse
+import time
+
+import can
+
+from canbus.handler import CANHandler
+
+MODULE_ID = 0x12
+
+
+def send_frames(interface, frames, modules):
+    bus = can.interface.Bus(interface, bustype='socketcan')
+    for index in range(frames):
+        data = [MODULE_ID + index % modules, 0x01, 0, 0, 0, index & 0xFF]
+        bus.send(can.Message(arbitration_id=0x123, data=data, is_extended_id=False))
+    bus.shutdown()
+
+
+def count_received(handler):
+    received = 0
+    while True:
+        batch = handler.drain()
+        if not batch:
+            return received
+        received += len(batch)
+
+
+def run(interface, frames, modules, module_id):
+    handler = CANHandler(interface, module_id=module_id)
+    # The receive buffer is drained in chunks so the kernel queue never fills.
+    received = 0
+    sent = 0
+    chunk = 100
+    start = time.perf_counter()
+    while sent < frames:
+        send_frames(interface, min(chunk, frames - sent), modules)
+        sent += chunk
+        time.sleep(0.001)
+        received += count_received(handler)
+    received += count_received(handler)
+    elapsed = time.perf_counter() - start
+    handler.bus.shutdown()
+    return received, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--interface', default='vcan0')
+    parser.add_argument('--frames', type=int, default=10000)
+    parser.add_argument('--modules', type=int, default=16)
+    args = parser.parse_args()
+
+    for name, module_id in (("unfiltered", None), ("filtered", MODULE_ID)):
+        received, elapsed = run(args.interface, args.frames, args.modules, module_id)
+        print(f"{name:>10}: {received}/{args.frames} frames reached Python in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
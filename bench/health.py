@@ -0,0 +1,85 @@
+"""
+Overload a CANHandler on a vcan interface and check that the bus health
+counters account for every frame: frames read plus kernel drops must equal
+frames sent.
+
+A subscriber that stalls the event loop for --stall ms per batch and a
+small --rcvbuf make the socket overflow. After the burst, one sentinel
+frame is sent: the kernel attaches the drop count to frames queued after
+the drops, so the sentinel carries the final total.
+
+    sudo ip link add dev vcan0 type vcan && sudo ip link set vcan0 up
+    python -m bench.health --interface vcan0 --frames 50000 --rcvbuf 4096
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.common import send_frames
+from canbus.handler import CANHandler
+
+
+class StallingSubscriber:
+    def __init__(self, stall):
+        self.stall = stall
+
+    def notify_batch(self, frames):
+        time.sleep(self.stall)
+
+
+async def settle(handler, expected, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if handler.health.frames_read + handler.health.kernel_drops >= expected:
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def run(interface, frames, rcvbuf, stall, timeout):
+    handler = CANHandler(interface, rcvbuf=rcvbuf)
+    handler.add_subscriber(StallingSubscriber(stall))
+    receiver = asyncio.create_task(handler.receive_can_message())
+    await asyncio.sleep(0.1)
+    handler.bus_health()
+
+    started = time.perf_counter()
+    sent = await asyncio.to_thread(send_frames, interface, frames)
+    # The sentinel, once the reader has drained what was queued.
+    await asyncio.sleep(0.5)
+    sent += await asyncio.to_thread(send_frames, interface, 1)
+    settled = await settle(handler, sent, timeout)
+    elapsed = time.perf_counter() - started
+
+    health = handler.bus_health()
+    read = handler.health.frames_read
+    handler.stop()
+    await receiver
+    handler.bus.shutdown()
+    return sent, read, settled, elapsed, health
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--interface', default='vcan0')
+    parser.add_argument('--frames', type=int, default=50000)
+    parser.add_argument('--rcvbuf', type=int, default=4096)
+    parser.add_argument('--stall', type=float, default=5, help="subscriber stall per batch, in ms")
+    parser.add_argument('--timeout', type=float, default=10.0)
+    args = parser.parse_args()
+
+    sent, read, settled, elapsed, health = asyncio.run(
+        run(args.interface, args.frames, args.rcvbuf, args.stall / 1000, args.timeout))
+    print(json.dumps(health, indent=2))
+
+    drops = health["kernel_drops"]
+    print(f"sent {sent} frames in {elapsed:.2f}s: read {read}, kernel drops {drops}")
+    if not settled or read + drops != sent:
+        print(f"FAIL: {sent - read - drops} frames unaccounted for")
+        raise SystemExit(1)
+    print("OK: frames read plus kernel drops match frames sent")
+
+
+if __name__ == "__main__":
+    main()
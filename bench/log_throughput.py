@@ -0,0 +1,60 @@
+"""
+Measure CANHandler dispatch throughput with per-frame debug logging enabled
+and disabled. Frames are fed through CANHandler.feed, so the handler's bus
+is only opened, not read.
+
+    python -m bench.log_throughput --interface vcan0 --frames 200000
+"""
+import argparse
+import asyncio
+import io
+import logging
+import struct
+import time
+
+from canbus.handler import CANHandler
+from canbus.log import configure
+from canbus.queues import DROP_OLDEST
+
+BATCH = 32
+
+
+class NullSubscriber:
+    def notify(self, value):
+        pass
+
+
+async def run(interface, frames, level):
+    logging.getLogger().setLevel(level)
+    handler = CANHandler(interface)
+    handler.add_subscriber(NullSubscriber(), policy=DROP_OLDEST)
+    batch = b"".join(struct.pack("=IB3x8s", 0x123, 6, bytes([0x12, index % 8, 0, 0, 0, index, 0, 0]))
+                     for index in range(BATCH))
+
+    start = time.perf_counter()
+    for _ in range(frames // BATCH):
+        handler.feed(batch)
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    handler.bus.shutdown()
+    return frames / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--interface', default='vcan0')
+    parser.add_argument('--frames', type=int, default=200000)
+    args = parser.parse_args()
+
+    # Records are formatted into memory so the terminal is not measured.
+    configure(stream=io.StringIO())
+    results = {}
+    for name, level in (("disabled", logging.INFO), ("enabled", logging.DEBUG)):
+        results[name] = asyncio.run(run(args.interface, args.frames, level))
+
+    for name, rate in results.items():
+        print(f"{name:>8}: {rate:.0f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare encode time per notification and bytes on air for the original
+string payload and the binary encoders in ble.payload.
+
+    python -m bench.payload --values 100000
+"""
+import argparse
+import random
+import time
+
+import dbus
+
+from ble.payload import ValueEncoder, StringEncoder, BatchEncoder
+
+
+def legacy_encode(value):
+    return [[dbus.Byte(c) for c in str(value).encode()]]
+
+
+def binary_encode(encoder, value):
+    return [dbus.ByteArray(payload) for payload in encoder.payloads(value)]
+
+
+def measure(name, updates, encode, value_count):
+    start = time.perf_counter()
+    payload_bytes = 0
+    notifications = 0
+    for update in updates:
+        for payload in encode(update):
+            payload_bytes += len(payload)
+            notifications += 1
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {1e6 * elapsed / value_count:.2f} us/value, "
+          f"{payload_bytes / value_count:.2f} bytes/value, {notifications} notifications")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--values', type=int, default=100000)
+    parser.add_argument('--keys', type=int, default=16)
+    args = parser.parse_args()
+
+    values = [random.getrandbits(32) for _ in range(args.values)]
+    string_encoder = StringEncoder()
+    value_encoder = ValueEncoder('I')
+    batch_encoder = BatchEncoder('I')
+
+    count = len(values)
+    measure("legacy", values, legacy_encode, count)
+    measure("string", values, lambda value: binary_encode(string_encoder, value), count)
+    measure("binary", values, lambda value: binary_encode(value_encoder, value), count)
+
+    # One batch per group of keys updated together.
+    groups = [list(enumerate(values[index:index + args.keys]))
+              for index in range(0, count, args.keys)]
+    measure("batch", groups, lambda group: binary_encode(batch_encoder, group), count)
+
+
+if __name__ == "__main__":
+    main()
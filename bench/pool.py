@@ -0,0 +1,73 @@
+"""
+Load several vcan interfaces at once and check that a CANHandlerPool
+receives every frame on every bus, and that the merged stream stays in
+timestamp order.
+
+    for i in 0 1 2 3; do
+        sudo ip link add dev vcan$i type vcan && sudo ip link set vcan$i up
+    done
+    python -m bench.pool --interfaces vcan0 vcan1 vcan2 vcan3 --frames 20000
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+from bench.common import CountingSubscriber, send_frames
+from canbus.pool import CANHandlerPool
+
+
+async def merge(stream, totals):
+    last = 0.0
+    async for timestamp, interface, frame in stream:
+        if timestamp < last:
+            totals["out_of_order"] += 1
+        last = timestamp
+        totals["merged"] += 1
+
+
+async def run(interfaces, frames, timeout):
+    pool = CANHandlerPool(interfaces)
+    subscribers = {}
+    for interface in interfaces:
+        subscribers[interface] = CountingSubscriber()
+        pool.add_subscriber(subscribers[interface], interface)
+
+    totals = {"merged": 0, "out_of_order": 0}
+    receiver = asyncio.create_task(pool.receive_can_message())
+    merger = asyncio.create_task(merge(pool.merged(), totals))
+    await asyncio.sleep(0.1)
+
+    senders = [threading.Thread(target=send_frames, args=(interface, frames)) for interface in interfaces]
+    start = time.perf_counter()
+    for sender in senders:
+        sender.start()
+
+    expected = frames * len(interfaces)
+    deadline = time.monotonic() + timeout
+    while totals["merged"] < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    for sender in senders:
+        sender.join()
+    receiver.cancel()
+    merger.cancel()
+
+    for interface, subscriber in subscribers.items():
+        print(f"{interface}: {subscriber.count}/{frames} frames")
+    print(f"merged: {totals['merged']}/{expected} frames, {totals['out_of_order']} out of order, "
+          f"{totals['merged'] / elapsed:.0f} frames/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--interfaces', nargs='+', default=['vcan0', 'vcan1'])
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.interfaces, args.frames, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
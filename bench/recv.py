@@ -0,0 +1,54 @@
+"""
+Compare the native and threaded CANHandler receive paths on a vcan interface.
+
+    sudo ip link add dev vcan0 type vcan && sudo ip link set vcan0 up
+    python -m bench.recv --interface vcan0 --frames 20000
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+from bench.common import CountingSubscriber, send_frames
+from canbus.handler import CANHandler
+
+
+async def run(interface, frames, native, timeout):
+    handler = CANHandler(interface, native_receive=native)
+    subscriber = CountingSubscriber(frames)
+    handler.add_subscriber(subscriber)
+    receiver = asyncio.create_task(handler.receive_can_message())
+    await asyncio.sleep(0.1)
+
+    sender = threading.Thread(target=send_frames, args=(interface, frames))
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    sender.start()
+    try:
+        await asyncio.wait_for(subscriber.done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    receiver.cancel()
+    sender.join()
+    handler.bus.shutdown()
+    return subscriber.count, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--interface', default='vcan0')
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    for name, native in (("threaded", False), ("native", True)):
+        count, wall, cpu = asyncio.run(run(args.interface, args.frames, native, args.timeout))
+        print(f"{name:>8}: {count}/{args.frames} frames, {count / wall:.0f} frames/s, "
+              f"CPU {100 * cpu / wall:.0f}% (sender included)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure frames/s and bytes allocated per frame for the legacy
+build-a-Message send and the preallocated FrameSender paths.
+
+Throughput is timed over --frames sends without tracing. Allocation is
+measured in a second pass over --traced-frames: tracemalloc's peak is reset
+before every call, so what the call allocated and freed again is counted
+as well as what it kept.
+
+    python -m bench.send --interface vcan0 --frames 20000
+"""
+import argparse
+import threading
+import time
+import tracemalloc
+
+import can
+
+from canbus.handler import CANHandler
+
+CAN_ID = 0x123
+MODULE_ID = 0x12
+# Frames per send_many call in the traced pass.
+BURST = 64
+
+
+def legacy_send(bus, key, value):
+    key_bytes = key.to_bytes(1, byteorder='big')
+    value_bytes = value.to_bytes(4, byteorder='big')
+    data = MODULE_ID.to_bytes(1, byteorder='big') + key_bytes + value_bytes
+    bus.send(can.Message(arbitration_id=CAN_ID, data=data, is_extended_id=False))
+
+
+def drain(interface, stop):
+    # Keep the interface queues moving so ENOBUFS doesn't dominate the run.
+    bus = can.interface.Bus(interface, bustype='socketcan')
+    while not stop.is_set():
+        bus.recv(timeout=0.1)
+    bus.shutdown()
+
+
+def allocated_per_frame(send, batches):
+    # Peak traced memory above what was allocated before each call.
+    allocated = frames = 0
+    tracemalloc.start()
+    try:
+        for batch in batches:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            send(batch)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+            frames += len(batch)
+    finally:
+        tracemalloc.stop()
+    return allocated / frames
+
+
+def measure(name, items, traced, send, batch_size=1):
+    start = time.perf_counter()
+    send(items)
+    elapsed = time.perf_counter() - start
+    batches = [traced[index:index + batch_size] for index in range(0, len(traced), batch_size)]
+    allocated = allocated_per_frame(send, batches)
+    print(f"{name:>10}: {len(items) / elapsed:.0f} frames/s, {allocated:.1f} peak bytes/frame")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--interface', default='vcan0')
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--traced-frames', type=int, default=2000)
+    args = parser.parse_args()
+
+    handler = CANHandler(args.interface, can_id=CAN_ID, module_id=MODULE_ID)
+    stop = threading.Event()
+    reader = threading.Thread(target=drain, args=(args.interface, stop))
+    reader.start()
+
+    items = [(index & 0xFF, index) for index in range(args.frames)]
+    traced = items[:args.traced_frames]
+
+    def send_legacy(batch):
+        for key, value in batch:
+            legacy_send(handler.bus, key, value)
+
+    def send_single(batch):
+        for key, value in batch:
+            handler.send_can_message(key, value)
+
+    def send_burst(batch):
+        handler.send_many(batch)
+
+    try:
+        measure("legacy", items, traced, send_legacy)
+        measure("fast", items, traced, send_single)
+        measure("send_many", items, traced, send_burst, BURST)
+    finally:
+        stop.set()
+        reader.join()
+        handler.bus.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare single-process and split-process (canbus.ring) deployments on a
+vcan interface: throughput and send-to-subscriber latency percentiles.
+
+Each frame carries the sender's monotonic clock in microseconds as its
+value, so the subscriber can measure latency across processes. --work
+simulates per-batch D-Bus/notification cost on the subscriber side, which
+is what the split is meant to keep away from the receive path.
+
+    sudo ip link add dev vcan0 type vcan && sudo ip link set vcan0 up
+    python -m bench.split --interface vcan0 --frames 20000 --work 200
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+from bench.common import now_us, send_frames
+from canbus.handler import CANHandler
+from canbus.ring import RingBuffer, RingHandler, start_ingest
+from canbus.tracing import Histogram
+
+
+class LatencySubscriber:
+    def __init__(self, expected, work_us):
+        self.expected = expected
+        self.work = work_us / 1e6
+        self.count = 0
+        self.latency = Histogram()
+        self.done = asyncio.Event()
+
+    def notify_batch(self, frames):
+        now = now_us()
+        for _, _, _, value in frames:
+            self.latency.record(((now - int(value)) & 0xFFFFFFFF) * 1000)
+        self.count += len(frames)
+        # Busy-wait: this is CPU spent by the BLE side, not idle time.
+        deadline = time.perf_counter() + self.work
+        while time.perf_counter() < deadline:
+            pass
+        if self.count >= self.expected:
+            self.done.set()
+
+
+async def run(interface, frames, split, work_us, timeout):
+    ring = ingest = None
+    if split:
+        ring = RingBuffer(capacity=65536, create=True)
+        ingest = start_ingest(ring.name, interface)
+        handler = RingHandler(ring.name)
+    else:
+        handler = CANHandler(interface)
+    subscriber = LatencySubscriber(frames, work_us)
+    handler.add_subscriber(subscriber)
+    receiver = asyncio.create_task(handler.receive_can_message())
+    await asyncio.sleep(0.5)
+
+    sender = threading.Thread(target=send_frames, args=(interface, frames, True))
+    wall = time.perf_counter()
+    sender.start()
+    try:
+        await asyncio.wait_for(subscriber.done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    wall = time.perf_counter() - wall
+
+    receiver.cancel()
+    sender.join()
+    stats = {"queue": handler.subscriber_stats()[subscriber]}
+    if split:
+        stats["ring"] = handler.reader.stats()
+        ingest.terminate()
+        ingest.join()
+        ring.close()
+        ring.unlink()
+    else:
+        handler.bus.shutdown()
+    return subscriber, wall, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--interface', default='vcan0')
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--work', type=float, default=0, help="simulated subscriber work per batch, in µs")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    for name, split in (("single", False), ("split", True)):
+        subscriber, wall, stats = asyncio.run(run(args.interface, args.frames, split, args.work, args.timeout))
+        summary = subscriber.latency.summary()
+        print(f"{name:>6}: {subscriber.count}/{args.frames} frames, {subscriber.count / wall:.0f} frames/s, "
+              f"latency p50 {summary['p50_us']:.0f} µs p99 {summary['p99_us']:.0f} µs")
+        print(f"        {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Time from process start to a registered GATT application and advertisement,
+against a private dbus-daemon with a stub BlueZ, so no adapter or root is
+needed.
+
+The stub exports an ObjectManager with one adapter. On RegisterApplication
+it reads the application's object tree and on RegisterAdvertisement the
+advertisement's properties, as BlueZ does, with --delay ms of simulated
+bluetoothd latency on every call.
+
+Two modes run in fresh processes:
+  sequential  looks the adapter up for each registration and waits for
+              each reply in turn, as ble_transceiver did before BleContext
+  shared      one BleContext: a single cached lookup, both registrations
+              in flight together
+
+    python -m bench.startup --trials 10 --delay 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BUS_CONFIG = """<!DOCTYPE busconfig PUBLIC "-//freedesktop//DTD D-Bus Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+  <type>session</type>
+  <listen>unix:dir={directory}</listen>
+  <auth>EXTERNAL</auth>
+  <policy context="default">
+    <allow send_destination="*"/>
+    <allow receive_sender="*"/>
+    <allow own="*"/>
+  </policy>
+</busconfig>
+"""
+
+ADAPTER_PATH = "/org/bluez/hci0"
+
+
+def run_stub(delay):
+    import dbus
+    import dbus.mainloop.glib
+    import dbus.service
+    from gi.repository import GLib
+
+    from ble.bletools import (BLUEZ_SERVICE_NAME, DBUS_OM_IFACE, DBUS_PROP_IFACE, ADAPTER_IFACE,
+                              GATT_MANAGER_IFACE, LE_ADVERTISING_MANAGER_IFACE)
+    from ble.advertisement import LE_ADVERTISEMENT_IFACE
+
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    bus = dbus.SystemBus()
+
+    def later(callback, *args, **kwargs):
+        GLib.timeout_add(delay, lambda: callback(*args, **kwargs) and False)
+
+    class ObjectManager(dbus.service.Object):
+        @dbus.service.method(DBUS_OM_IFACE, out_signature="a{oa{sa{sv}}}",
+                             async_callbacks=("reply", "error"))
+        def GetManagedObjects(self, reply, error):
+            later(reply, {
+                dbus.ObjectPath(ADAPTER_PATH): {
+                    ADAPTER_IFACE: {"Powered": dbus.Boolean(True)},
+                    GATT_MANAGER_IFACE: {},
+                    LE_ADVERTISING_MANAGER_IFACE: {},
+                },
+            })
+
+    class Adapter(dbus.service.Object):
+        @dbus.service.method(GATT_MANAGER_IFACE, in_signature="oa{sv}", sender_keyword="sender",
+                             async_callbacks=("reply", "error"))
+        def RegisterApplication(self, path, options, sender, reply, error):
+            manager = dbus.Interface(bus.get_object(sender, path, introspect=False), DBUS_OM_IFACE)
+            later(manager.GetManagedObjects, reply_handler=lambda objects: reply(), error_handler=error)
+
+        @dbus.service.method(LE_ADVERTISING_MANAGER_IFACE, in_signature="oa{sv}", sender_keyword="sender",
+                             async_callbacks=("reply", "error"))
+        def RegisterAdvertisement(self, path, options, sender, reply, error):
+            properties = dbus.Interface(bus.get_object(sender, path, introspect=False), DBUS_PROP_IFACE)
+            later(properties.GetAll, LE_ADVERTISEMENT_IFACE,
+                  reply_handler=lambda values: reply(), error_handler=error)
+
+    # Only held so the bus name and exported objects stay alive until the
+    # loop returns.
+    _name = dbus.service.BusName(BLUEZ_SERVICE_NAME, bus)
+    _objects = [ObjectManager(bus, "/"), Adapter(bus, ADAPTER_PATH)]
+    print("ready", flush=True)
+    GLib.MainLoop().run()
+    del _name, _objects
+
+
+def start_private_bus(directory, delay=0):
+    """
+    Start a dbus-daemon listening in directory and a stub BlueZ on it.
+    Returns both processes and the bus address, to be used as
+    DBUS_SYSTEM_BUS_ADDRESS.
+    """
+    config = os.path.join(directory, "bus.conf")
+    with open(config, "w") as f:
+        f.write(BUS_CONFIG.format(directory=directory))
+    daemon = subprocess.Popen(["dbus-daemon", "--config-file", config, "--nofork", "--print-address"],
+                              stdout=subprocess.PIPE, text=True)
+    address = daemon.stdout.readline().strip()
+    stub = subprocess.Popen([sys.executable, "-m", "bench.startup", "--stub", "--delay", str(delay)],
+                            env=dict(os.environ, DBUS_SYSTEM_BUS_ADDRESS=address),
+                            stdout=subprocess.PIPE, text=True)
+    # The stub prints once its name and objects are exported.
+    stub.stdout.readline()
+    return daemon, stub, address
+
+
+def stop_private_bus(daemon, stub):
+    stub.terminate()
+    daemon.terminate()
+    stub.wait()
+    daemon.wait()
+
+
+def run_client(mode, services):
+    started = time.perf_counter()
+
+    import asyncio
+    from ble import mainloop
+    from ble.advertisement import Advertisement
+    from ble.bletools import BleContext
+    from ble.service import Application, Service, Characteristic
+
+    async def main():
+        context = BleContext()
+        app = Application(context)
+        for index in range(services):
+            service = Service(index, f"{index + 1:08x}-710e-4a5b-8d75-3e5b444bc3cf", True, context)
+            for number in range(4):
+                service.add_characteristic(Characteristic(
+                    f"{index + 1:04x}{number:04x}-710e-4a5b-8d75-3e5b444bc3cf", ["read", "notify"], service))
+            app.add_service(service)
+        adv = Advertisement(0, "peripheral", context)
+        adv.add_local_name("Bench")
+
+        loop = asyncio.get_running_loop()
+        if mode == "sequential":
+            for registrant in (app, adv):
+                context.invalidate_adapter()
+                await registrant.register(loop.create_future())
+        else:
+            await context.register(app, adv)
+
+    mainloop.run(main())
+    print(f"{(time.perf_counter() - started) * 1000:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--delay', type=int, default=20, help="simulated BlueZ latency per call, in ms")
+    parser.add_argument('--services', type=int, default=3)
+    parser.add_argument('--stub', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--client', choices=("sequential", "shared"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub:
+        return run_stub(args.delay)
+    if args.client:
+        return run_client(args.client, args.services)
+
+    with tempfile.TemporaryDirectory() as directory:
+        daemon, stub, address = start_private_bus(directory, args.delay)
+        env = dict(os.environ, DBUS_SYSTEM_BUS_ADDRESS=address)
+        try:
+            for mode in ("sequential", "shared"):
+                times = []
+                for _ in range(args.trials):
+                    output = subprocess.run(
+                        [sys.executable, "-m", "bench.startup", "--client", mode, "--services", str(args.services)],
+                        env=env, stdout=subprocess.PIPE, text=True, check=True).stdout
+                    times.append(float(output.split()[-1]))
+                print(f"{mode:>10}: median {statistics.median(times):.1f} ms, "
+                      f"min {min(times):.1f} ms, max {max(times):.1f} ms over {args.trials} runs")
+        finally:
+            stop_private_bus(daemon, stub)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import dbus
 import dbus.service
+import logging
 
-from ble.bletools import BleTools
+from ble.bletools import BleContext
+from ble.service import InvalidArgsException
 
 BLUEZ_SERVICE_NAME = "org.bluez"
 LE_ADVERTISING_MANAGER_IFACE = "org.bluez.LEAdvertisingManager1"
@@ -9,13 +11,17 @@ DBUS_OM_IFACE = "org.freedesktop.DBus.ObjectManager"
 DBUS_PROP_IFACE = "org.freedesktop.DBus.Properties"
 LE_ADVERTISEMENT_IFACE = "org.bluez.LEAdvertisement1"
 
+log = logging.getLogger(__name__)
+
 
 class Advertisement(dbus.service.Object):
     PATH_BASE = "/org/bluez/example/advertisement"
 
-    def __init__(self, index, advertising_type):
+    def __init__(self, index, advertising_type, context=None):
         self.path = self.PATH_BASE + str(index)
-        self.bus = BleTools.get_bus()
+        self.context = context or BleContext.default()
+        self.bus = self.context.bus
+        self._registered = None
         self.ad_type = advertising_type
         self.local_name = None
         self.service_uuids = None
@@ -94,20 +100,24 @@ class Advertisement(dbus.service.Object):
                          in_signature='',
                          out_signature='')
     def Release(self):
-        print ('%s: Released!' % self.path)
+        log.info("%s: Released!", self.path)
 
     def register_ad_callback(self):
-        print("GATT advertisement registered")
-
-    def register_ad_error_callback(self):
-        print("Failed to register GATT advertisement")
-
-    def register(self):
-        bus = BleTools.get_bus()
-        adapter = BleTools.find_adapter(bus)
-
-        ad_manager = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, adapter),
-                                LE_ADVERTISING_MANAGER_IFACE)
+        log.info("GATT advertisement registered")
+        if self._registered is not None and not self._registered.done():
+            self._registered.set_result(None)
+
+    def register_ad_error_callback(self, error):
+        log.error("Failed to register GATT advertisement: %s", error)
+        if self._registered is not None and not self._registered.done():
+            self._registered.set_exception(error)
+
+    def register(self, future=None):
+        # Returns without waiting for BlueZ; the optional future resolves
+        # with the reply.
+        self._registered = future
+        ad_manager = self.context.adapter_interface(LE_ADVERTISING_MANAGER_IFACE)
         ad_manager.RegisterAdvertisement(self.get_path(), {},
                                      reply_handler=self.register_ad_callback,
                                      error_handler=self.register_ad_error_callback)
+        return future
@@ -1,44 +1,69 @@
 import dbus
+import dbus.exceptions
+import os
+import logging
+import sys
 import time
-import asyncio
 
+from ble import mainloop
 from ble.advertisement import Advertisement
+from ble.bletools import BleContext
 from ble.service import Application, Service, Characteristic, Descriptor
+from ble.notifier import NotificationScheduler
+from ble.payload import BatchEncoder
+from ble.signals import SignalService
+from ble.commands import CommandService
 from canbus.handler import CANHandler
+from canbus.ring import DEFAULT_CAPACITY, RingBuffer, RingHandler, start_ingest
+from canbus.signals import SignalDatabase
+from canbus import tracing
+from canbus.log import configure as configure_logging
+from canbus.queues import COALESCE
 
 GATT_CHRC_IFACE = "org.bluez.GattCharacteristic1"
 NOTIFY_TIMEOUT = 1000
+# Destination of writes to the command characteristics.
+COMMAND_CAN_ID = 0x123
+COMMAND_MODULE_ID = 0x12
+
+log = logging.getLogger(__name__)
 
 class CountAdvertisement(Advertisement):
-    def __init__(self, index):
-        Advertisement.__init__(self, index, "peripheral")
+    def __init__(self, index, context=None):
+        Advertisement.__init__(self, index, "peripheral", context)
         self.add_local_name("Count")
         self.include_tx_power = True
 
 class CountService(Service):
     COUNT_SVC_UUID = "00000001-710e-4a5b-8d75-3e5b444bc3cf"
 
-    def __init__(self, index, can_handler):
+    def __init__(self, index, can_handler, notifier=None, context=None):
         self.can_handler = can_handler
-        Service.__init__(self, index, self.COUNT_SVC_UUID, True)
+        self.notifier = notifier or NotificationScheduler()
+        Service.__init__(self, index, self.COUNT_SVC_UUID, True, context)
         self.add_characteristic(CountCharacteristic(self))
+        self.add_characteristic(CountBatchCharacteristic(self))
 
 class CountCharacteristic(Characteristic):
     COUNT_CHARACTERISTIC_UUID = "00000004-710e-4a5b-8d75-3e5b444bc3cf"
 
-    def __init__(self, service):
+    def __init__(self, service, encoder=None):
         self.notifying = False
 
-        Characteristic.__init__(self, self.COUNT_CHARACTERISTIC_UUID, ["notify"], service)
+        Characteristic.__init__(self, self.COUNT_CHARACTERISTIC_UUID, ["read", "notify"], service, encoder)
         self.add_descriptor(CountDescriptor(self))
 
+    def ReadValue(self, options):
+        last = self.service.can_handler.cache.last
+        return self.read_value(None if last is None else last[3], options)
+
     def StartNotify(self):
         if self.notifying:
             return False
         
         self.notifying = True
 
-        self.service.can_handler.add_subscriber(self)
+        self.service.can_handler.add_subscriber(self, policy=COALESCE)
 
         return True
 
@@ -47,15 +72,45 @@ class CountCharacteristic(Characteristic):
             return
         self.notifying = False
         self.service.can_handler.remove_subscriber(self)
+        self.service.notifier.cancel(self)
 
-    async def notify(self, value):
-        while self.notifying:
-            count_value = str(value).encode()
+    def notify(self, value):
+        if self.notifying:
+            self.service.notifier.update(self, value)
+
+class CountBatchCharacteristic(Characteristic):
+    """
+    Notifies every key updated within one notifier interval together, as
+    1 byte key plus uint32 value records packed into MTU-sized payloads.
+    """
+    COUNT_BATCH_CHARACTERISTIC_UUID = "00000005-710e-4a5b-8d75-3e5b444bc3cf"
+
+    def __init__(self, service):
+        self.notifying = False
 
-            print("COUNT: ", count_value)
-            self.PropertiesChanged("org.bluez.GattCharacteristic1", {"Value": [dbus.Byte(c) for c in count_value]}, [])
-            
-            await asyncio.sleep(1)
+        Characteristic.__init__(self, self.COUNT_BATCH_CHARACTERISTIC_UUID, ["notify"], service,
+                                BatchEncoder('I'))
+
+    def StartNotify(self):
+        if self.notifying:
+            return False
+
+        self.notifying = True
+
+        self.service.can_handler.add_subscriber(self, policy=COALESCE)
+
+        return True
+
+    def StopNotify(self):
+        if not self.notifying:
+            return
+        self.notifying = False
+        self.service.can_handler.remove_subscriber(self)
+        self.service.notifier.cancel(self)
+
+    def notify_batch(self, frames):
+        if self.notifying:
+            self.service.notifier.update_many(self, [(key, value) for _, _, key, value in frames])
 
 class CountDescriptor(Descriptor):
     COUNT_DESCRIPTOR_UUID = "2901"
@@ -69,21 +124,65 @@ class CountDescriptor(Descriptor):
         return value
     
 async def main():
-    can_handler = CANHandler()
-    await can_handler.receive_can_message()
-
-    app = Application()
-    app.add_service(CountService(0, can_handler))
-    app.register()
-
-    adv = CountAdvertisement(0)
-    adv.register()
-
+    started = time.monotonic()
+    # One system bus connection and adapter lookup for everything below.
+    context = BleContext.default()
+
+    # An optional signal database path generates a characteristic per signal.
+    database_path = sys.argv[1] if len(sys.argv) > 1 else None
+    database = SignalDatabase.load(database_path) if database_path else None
+
+    # CANBUS_SPLIT=1 moves CAN ingest into its own process, feeding this one
+    # through a shared memory ring.
+    ring = None
+    if os.environ.get("CANBUS_SPLIT") == "1":
+        ring = RingBuffer(capacity=int(os.environ.get("CANBUS_RING_SIZE", DEFAULT_CAPACITY)), create=True)
+        start_ingest(ring.name, database_path=database_path)
+        can_handler = RingHandler(ring.name, signals=database)
+    else:
+        # Characteristics are read from the handler's last-value cache at
+        # any time, so ingest must not park while nobody is notifying.
+        can_handler = CANHandler(signals=database, demand_driven=False)
+
+    app = Application(context)
+    if database is None:
+        app.add_service(CountService(0, can_handler, context=context))
+    else:
+        # Decoded signal values can be negative, scaled or wider than the
+        # uint32 CountCharacteristic sends, so only the signal service runs.
+        app.add_service(SignalService(1, can_handler, database, context=context))
+    if ring is None:
+        # Only the ingest process can send in a split deployment.
+        app.add_service(CommandService(2, can_handler, COMMAND_CAN_ID, COMMAND_MODULE_ID, context))
+    adv = CountAdvertisement(0, context)
     try:
-        app.run()
-    except KeyboardInterrupt:
-        app.quit()
+        await context.register(app, adv)
+        log.info("Advertising %.0f ms after start", (time.monotonic() - started) * 1000)
+    except dbus.exceptions.DBusException:
+        # Already logged by the registration callbacks.
+        pass
+
+    # Latency tracing: percentiles are printed on SIGUSR1 and served on the
+    # given UNIX socket.
+    trace_socket = os.environ.get("CANBUS_TRACE_SOCKET")
+    if trace_socket:
+        tracing.tracer.enable()
+        tracing.tracer.install_signal_handler()
+        await tracing.tracer.serve(trace_socket)
+
+    # The GLib-backed asyncio loop dispatches D-Bus, so app.run() is not
+    # needed; receiving CAN frames keeps the loop alive.
+    try:
+        await can_handler.receive_can_message()
+    finally:
         can_handler.stop()
+        if ring is not None:
+            ring.close()
+            ring.unlink()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    configure_logging()
+    try:
+        mainloop.run(main())
+    except KeyboardInterrupt:
+        log.info("GATT application terminated")
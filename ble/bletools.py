@@ -1,4 +1,7 @@
+import asyncio
 import dbus
+import dbus.mainloop.glib
+import logging
 try:
   from gi.repository import GObject
 except ImportError:
@@ -6,7 +9,12 @@ except ImportError:
 
 BLUEZ_SERVICE_NAME = "org.bluez"
 LE_ADVERTISING_MANAGER_IFACE = "org.bluez.LEAdvertisingManager1"
+GATT_MANAGER_IFACE = "org.bluez.GattManager1"
+ADAPTER_IFACE = "org.bluez.Adapter1"
 DBUS_OM_IFACE = "org.freedesktop.DBus.ObjectManager"
+DBUS_PROP_IFACE = "org.freedesktop.DBus.Properties"
+
+log = logging.getLogger(__name__)
 
 class BleTools(object):
     @classmethod
@@ -28,9 +36,75 @@ class BleTools(object):
         return None
 
     @classmethod
-    def power_adapter(self):
-        adapter = self.get_adapter()
+    def power_adapter(self, bus=None):
+        bus = bus or self.get_bus()
+        adapter = self.find_adapter(bus)
 
         adapter_props = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, adapter),
-                "org.freedesktop.DBus.Properties");
-        adapter_props.Set("org.bluez.Adapter1", "Powered", dbus.Boolean(1))
+                DBUS_PROP_IFACE)
+        adapter_props.Set(ADAPTER_IFACE, "Powered", dbus.Boolean(1))
+
+
+class BleContext(object):
+    """
+    The system bus connection and BlueZ adapter lookup shared by the
+    application, its services and advertisements. The adapter path is
+    looked up once and forgotten when BlueZ removes that adapter.
+    """
+    _default = None
+
+    @classmethod
+    def default(cls):
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def __init__(self, bus=None):
+        # Signal handlers need the GLib main loop set before connecting.
+        dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+        self.bus = bus or BleTools.get_bus()
+        self._adapter = None
+        self._objects = {}
+        self.bus.add_signal_receiver(self._interfaces_removed,
+                                     signal_name="InterfacesRemoved",
+                                     dbus_interface=DBUS_OM_IFACE,
+                                     bus_name=BLUEZ_SERVICE_NAME)
+
+    def _interfaces_removed(self, path, interfaces):
+        if path == self._adapter:
+            log.warning("Adapter %s removed", path)
+            self.invalidate_adapter()
+
+    def invalidate_adapter(self):
+        self._adapter = None
+        self._objects.clear()
+
+    def get_object(self, path):
+        # BlueZ interfaces are known, so skip the Introspect round trip.
+        proxy = self._objects.get(path)
+        if proxy is None:
+            proxy = self._objects[path] = self.bus.get_object(BLUEZ_SERVICE_NAME, path, introspect=False)
+        return proxy
+
+    def find_adapter(self):
+        if self._adapter is None:
+            self._adapter = BleTools.find_adapter(self.bus)
+            if self._adapter is None:
+                raise RuntimeError("No BlueZ adapter with LE advertising found")
+            log.info("Using adapter %s", self._adapter)
+        return self._adapter
+
+    def adapter_interface(self, interface):
+        return dbus.Interface(self.get_object(self.find_adapter()), interface)
+
+    def power_adapter(self):
+        self.adapter_interface(DBUS_PROP_IFACE).Set(ADAPTER_IFACE, "Powered", dbus.Boolean(1))
+
+    async def register(self, application, *advertisements):
+        # All registrations are sent before waiting for any reply, so the
+        # BlueZ round trips overlap.
+        self.find_adapter()
+        loop = asyncio.get_running_loop()
+        futures = [application.register(loop.create_future())]
+        futures += [advertisement.register(loop.create_future()) for advertisement in advertisements]
+        await asyncio.gather(*futures)
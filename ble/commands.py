@@ -0,0 +1,57 @@
+import dbus
+import struct
+
+from ble.service import Service, Characteristic, Descriptor, InvalidValueLengthException
+from canbus.scheduler import SAFETY, CONTROL, BULK
+
+UUID_SUFFIX = "-710e-4a5b-8d75-3e5b444bc3cf"
+
+# A write is a 1 byte key and a 4 byte big-endian value, as on the wire.
+COMMAND_STRUCT = struct.Struct(">BI")
+
+
+class CommandService(Service):
+    """
+    Writable characteristics forwarding phone writes to the CAN bus through
+    CANHandler.schedule, one characteristic per send priority class. Writes
+    only enqueue, so BlueZ gets its reply without waiting on the bus.
+    """
+    COMMAND_SVC_UUID = "00000005" + UUID_SUFFIX
+
+    def __init__(self, index, can_handler, can_id, module_id, context=None):
+        self.can_handler = can_handler
+        self.can_id = can_id
+        self.module_id = module_id
+        Service.__init__(self, index, self.COMMAND_SVC_UUID, True, context)
+
+        self.add_characteristic(CommandCharacteristic(
+            self, "00000006" + UUID_SUFFIX, SAFETY, "Safety command"))
+        self.add_characteristic(CommandCharacteristic(
+            self, "00000007" + UUID_SUFFIX, CONTROL, "Control command"))
+        self.add_characteristic(CommandCharacteristic(
+            self, "00000008" + UUID_SUFFIX, BULK, "Configuration write"))
+
+
+class CommandCharacteristic(Characteristic):
+    def __init__(self, service, uuid, priority, description):
+        self.priority = priority
+        Characteristic.__init__(self, uuid, ["write", "write-without-response"], service)
+        self.add_descriptor(CommandDescriptor(self, description))
+
+    def WriteValue(self, value, options):
+        if len(value) != COMMAND_STRUCT.size:
+            raise InvalidValueLengthException()
+        key, value = COMMAND_STRUCT.unpack(bytes(value))
+        service = self.service
+        service.can_handler.schedule(key, value, self.priority, service.can_id, service.module_id)
+
+
+class CommandDescriptor(Descriptor):
+    COMMAND_DESCRIPTOR_UUID = "2901"
+
+    def __init__(self, characteristic, description):
+        self.value = dbus.ByteArray(description.encode())
+        Descriptor.__init__(self, self.COMMAND_DESCRIPTOR_UUID, ["read"], characteristic)
+
+    def ReadValue(self, options):
+        return self.value
@@ -0,0 +1,120 @@
+"""
+Runs asyncio on top of the GLib main context so CAN receive, BLE
+notifications and D-Bus method calls share one thread.
+
+The asyncio loop uses a selector that blocks in GLib's main context rather
+than in select/epoll. Sockets asyncio watches are polled by a GLib source,
+so one GLib iteration dispatches D-Bus traffic and wakes asyncio for ready
+sockets and timers alike.
+
+dbus-python honours DBUS_SYSTEM_BUS_ADDRESS, so the integrated loop can be
+pointed at a private dbus-daemon standing in for BlueZ.
+"""
+import asyncio
+import math
+import selectors
+
+from gi.repository import GLib
+
+
+class SelectorSource(GLib.Source):
+    """
+    A single GLib source carrying every fd asyncio watches. It becomes ready
+    when any of them polls ready or when asyncio's next timer is due.
+    """
+    def __init__(self):
+        super().__init__()
+        self._tags = {}
+        self.ready = {}
+
+    def prepare(self):
+        return False, -1
+
+    def check(self):
+        return False
+
+    def dispatch(self, callback, args):
+        for fd, tag in self._tags.items():
+            condition = self.query_unix_fd(tag)
+            events = 0
+            if condition & (GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR):
+                events |= selectors.EVENT_READ
+            if condition & (GLib.IOCondition.OUT | GLib.IOCondition.HUP | GLib.IOCondition.ERR):
+                events |= selectors.EVENT_WRITE
+            if events:
+                self.ready[fd] = events
+        self.set_ready_time(-1)
+        return GLib.SOURCE_CONTINUE
+
+    def add(self, fd, events):
+        condition = GLib.IOCondition(0)
+        if events & selectors.EVENT_READ:
+            condition |= GLib.IOCondition.IN
+        if events & selectors.EVENT_WRITE:
+            condition |= GLib.IOCondition.OUT
+        self._tags[fd] = self.add_unix_fd(fd, condition)
+
+    def remove(self, fd):
+        self.remove_unix_fd(self._tags.pop(fd))
+        self.ready.pop(fd, None)
+
+
+class GLibSelector(selectors._BaseSelectorImpl):
+    def __init__(self, context=None):
+        super().__init__()
+        self._context = context or GLib.MainContext.default()
+        self._source = SelectorSource()
+        self._source.attach(self._context)
+
+    def register(self, fileobj, events, data=None):
+        key = super().register(fileobj, events, data)
+        self._source.add(key.fd, events)
+        return key
+
+    def unregister(self, fileobj):
+        key = super().unregister(fileobj)
+        self._source.remove(key.fd)
+        return key
+
+    def select(self, timeout=None):
+        source = self._source
+        source.ready = {}
+
+        if timeout is not None and timeout <= 0:
+            self._context.iteration(False)
+        else:
+            if timeout is not None:
+                source.set_ready_time(GLib.get_monotonic_time() + math.ceil(timeout * 1e6))
+            # Returns after any dispatch, so work queued by a D-Bus handler
+            # (StartNotify, WriteValue) is picked up by asyncio straight away.
+            self._context.iteration(True)
+            source.set_ready_time(-1)
+
+        ready = []
+        for fd, events in source.ready.items():
+            key = self._fd_to_key.get(fd)
+            if key is not None and events & key.events:
+                ready.append((key, events & key.events))
+        return ready
+
+    def close(self):
+        self._source.destroy()
+        super().close()
+
+
+class GLibEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, context=None):
+        super().__init__(GLibSelector(context))
+
+
+def run(main):
+    loop = GLibEventLoop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
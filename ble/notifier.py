@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+from canbus import tracing
+
+DEFAULT_MAX_RATE = 10
+_UNSET = object()
+
+log = logging.getLogger(__name__)
+
+
+class NotificationScheduler:
+    """
+    Rate-limits characteristic notifications. Only the latest value per
+    characteristic is kept and a single emitter task per characteristic
+    sends it, at most max_rate times a second. Characteristics are expected
+    to implement send_value(value) to emit PropertiesChanged.
+
+    Characteristics updated through update_many instead keep a dict of
+    pending key -> value, so every key updated within one interval goes out
+    in the same send_value call, e.g. for a ble.payload.BatchEncoder.
+    """
+    def __init__(self, max_rate=DEFAULT_MAX_RATE, on_change=True):
+        self.interval = 1 / max_rate if max_rate else 0
+        self.on_change = on_change
+        self.updates = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.sent = 0
+        self._pending = {}
+        self._last_sent = {}
+        self._emitters = {}
+        self._batched = set()
+        # Characteristic -> frame key of its pending value, while tracing.
+        self._trace_keys = {}
+
+    def stats(self):
+        return {
+            "updates": self.updates,
+            "coalesced": self.coalesced,
+            "unchanged": self.unchanged,
+            "sent": self.sent,
+            "emitters": len(self._emitters),
+        }
+
+    def update(self, characteristic, value):
+        self.updates += 1
+        if characteristic in self._pending:
+            self.coalesced += 1
+        self._pending[characteristic] = value
+
+        tracer = tracing.tracer
+        if tracer.enabled and tracer.current is not None:
+            tracer.record_key(tracing.ENQUEUE, tracer.current)
+            self._trace_keys[characteristic] = tracer.current
+
+        self._start_emitter(characteristic)
+
+    def update_many(self, characteristic, items):
+        # items are (key, value) pairs; keys already pending are replaced.
+        self._batched.add(characteristic)
+        pending = self._pending.setdefault(characteristic, {})
+        for key, value in items:
+            self.updates += 1
+            if key in pending:
+                self.coalesced += 1
+            pending[key] = value
+        self._start_emitter(characteristic)
+
+    def _start_emitter(self, characteristic):
+        if characteristic not in self._emitters:
+            self._emitters[characteristic] = asyncio.get_running_loop().create_task(
+                self._emit(characteristic))
+
+    def _changed(self, characteristic, value):
+        # The value to send, or _UNSET when nothing changed since last sent.
+        if characteristic in self._batched:
+            last = self._last_sent.setdefault(characteristic, {})
+            if self.on_change:
+                value = {key: item for key, item in value.items() if last.get(key, _UNSET) != item}
+            return value or _UNSET
+        if self.on_change and self._last_sent.get(characteristic, _UNSET) == value:
+            return _UNSET
+        return value
+
+    def cancel(self, characteristic):
+        self._batched.discard(characteristic)
+        self._pending.pop(characteristic, None)
+        self._last_sent.pop(characteristic, None)
+        self._trace_keys.pop(characteristic, None)
+        emitter = self._emitters.pop(characteristic, None)
+        if emitter is not None:
+            emitter.cancel()
+
+    async def _emit(self, characteristic):
+        try:
+            while characteristic in self._pending:
+                value = self._changed(characteristic, self._pending.pop(characteristic))
+                if value is _UNSET:
+                    self.unchanged += 1
+                    continue
+
+                try:
+                    characteristic.send_value(value)
+                except Exception:
+                    log.exception("Error sending notification")
+                if tracing.tracer.enabled and characteristic in self._trace_keys:
+                    tracing.tracer.record_key(tracing.EMIT, self._trace_keys[characteristic])
+                if characteristic in self._batched:
+                    self._last_sent[characteristic].update(value)
+                else:
+                    self._last_sent[characteristic] = value
+                self.sent += 1
+
+                # Updates arriving during the interval replace each other.
+                await asyncio.sleep(self.interval)
+        finally:
+            if self._emitters.get(characteristic) is asyncio.current_task():
+                del self._emitters[characteristic]
@@ -0,0 +1,75 @@
+import struct
+
+# Default ATT MTU; each notification carries MTU - 3 bytes of value.
+DEFAULT_MTU = 23
+ATT_HEADER_LENGTH = 3
+
+
+INTEGER_FORMATS = ('b', 'B', 'h', 'H', 'i', 'I', 'q', 'Q')
+
+
+def value_format(minimum, maximum, is_float=False):
+    """
+    The narrowest struct format holding every value in [minimum, maximum]:
+    'f' for non-integer values, else the smallest integer format, falling
+    back to 'd' beyond 64 bits.
+    """
+    if is_float:
+        return 'f'
+    for fmt in INTEGER_FORMATS:
+        bits = struct.calcsize(fmt) * 8
+        if fmt.islower():
+            low, high = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+        else:
+            low, high = 0, (1 << bits) - 1
+        if low <= minimum and maximum <= high:
+            return fmt
+    return 'd'
+
+
+class ValueEncoder:
+    """
+    Packs a single value as fixed-width little-endian binary. fmt is a
+    struct format character, e.g. 'I' for unsigned 32 bit or 'h' for signed
+    16 bit.
+    """
+    def __init__(self, fmt='I'):
+        self._pack = struct.Struct('<' + fmt).pack
+
+    def payloads(self, value):
+        return (self._pack(value),)
+
+
+class StringEncoder:
+    """
+    The original ASCII decimal form, for clients that expect text.
+    """
+    def payloads(self, value):
+        return (str(value).encode(),)
+
+
+class BatchEncoder:
+    """
+    Packs (key, value) pairs as 1 byte key plus fixed-width little-endian
+    value records, filling each notification up to the ATT payload size.
+    """
+    def __init__(self, fmt='I', mtu=DEFAULT_MTU):
+        self._record = struct.Struct('<B' + fmt)
+        self.per_payload = max(1, (mtu - ATT_HEADER_LENGTH) // self._record.size)
+        self._buffer = bytearray(self._record.size * self.per_payload)
+
+    def payloads(self, items):
+        if isinstance(items, dict):
+            items = items.items()
+        pack_into = self._record.pack_into
+        size = self._record.size
+        buffer = self._buffer
+        offset = 0
+        for key, value in items:
+            pack_into(buffer, offset, key, value)
+            offset += size
+            if offset == len(buffer):
+                yield bytes(buffer)
+                offset = 0
+        if offset:
+            yield bytes(buffer[:offset])
@@ -1,11 +1,13 @@
 import dbus
 import dbus.mainloop.glib
 import dbus.exceptions
+import logging
 try:
   from gi.repository import GObject
 except ImportError:
     import gobject as GObject
-from ble.bletools import BleTools
+from ble.bletools import BleContext
+from ble.payload import ValueEncoder
 
 BLUEZ_SERVICE_NAME = "org.bluez"
 GATT_MANAGER_IFACE = "org.bluez.GattManager1"
@@ -15,6 +17,8 @@ GATT_SERVICE_IFACE = "org.bluez.GattService1"
 GATT_CHRC_IFACE =    "org.bluez.GattCharacteristic1"
 GATT_DESC_IFACE =    "org.bluez.GattDescriptor1"
 
+log = logging.getLogger(__name__)
+
 class InvalidArgsException(dbus.exceptions.DBusException):
     _dbus_error_name = "org.freedesktop.DBus.Error.InvalidArgs"
 
@@ -24,24 +28,40 @@ class NotSupportedException(dbus.exceptions.DBusException):
 class NotPermittedException(dbus.exceptions.DBusException):
     _dbus_error_name = "org.bluez.Error.NotPermitted"
 
+class InvalidValueLengthException(dbus.exceptions.DBusException):
+    _dbus_error_name = "org.bluez.Error.InvalidValueLength"
+
 class Application(dbus.service.Object):
-    def __init__(self):
-        dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    def __init__(self, context=None):
+        self.context = context or BleContext.default()
         self.mainloop = GObject.MainLoop()
-        self.bus = BleTools.get_bus()
+        self.bus = self.context.bus
         self.path = "/"
+        self._registered = None
         self.services = []
         self.next_index = 0
+        self._managed_objects = None
         dbus.service.Object.__init__(self, self.bus, self.path)
 
     def get_path(self):
         return dbus.ObjectPath(self.path)
 
     def add_service(self, service):
+        if service.context is not self.context:
+            raise ValueError(f"Service {service.path} was created with a different BleContext")
         self.services.append(service)
+        service.application = self
+        self.invalidate_managed_objects()
+
+    def invalidate_managed_objects(self):
+        self._managed_objects = None
 
     @dbus.service.method(DBUS_OM_IFACE, out_signature = "a{oa{sa{sv}}}")
     def GetManagedObjects(self):
+        # Rebuilt only after the tree or a property changes.
+        if self._managed_objects is not None:
+            return self._managed_objects
+
         response = {}
 
         for service in self.services:
@@ -53,45 +73,68 @@ class Application(dbus.service.Object):
                 for desc in descs:
                     response[desc.get_path()] = desc.get_properties()
 
+        self._managed_objects = response
         return response
 
     def register_app_callback(self):
-        print("GATT application registered")
+        log.info("GATT application registered")
+        if self._registered is not None and not self._registered.done():
+            self._registered.set_result(None)
 
     def register_app_error_callback(self, error):
-        print("Failed to register application: " + str(error))
-
-    def register(self):
-        adapter = BleTools.find_adapter(self.bus)
-
-        service_manager = dbus.Interface(
-                self.bus.get_object(BLUEZ_SERVICE_NAME, adapter),
-                GATT_MANAGER_IFACE)
-
+        log.error("Failed to register application: %s", error)
+        if self._registered is not None and not self._registered.done():
+            self._registered.set_exception(error)
+
+    def register(self, future=None):
+        # Returns without waiting for BlueZ; the optional future resolves
+        # with the reply.
+        self._registered = future
+        service_manager = self.context.adapter_interface(GATT_MANAGER_IFACE)
         service_manager.RegisterApplication(self.get_path(), {},
                 reply_handler=self.register_app_callback,
                 error_handler=self.register_app_error_callback)
+        return future
 
     def run(self):
         self.mainloop.run()
 
     def quit(self):
-        print("\nGATT application terminated")
+        log.info("GATT application terminated")
         self.mainloop.quit()
 
 class Service(dbus.service.Object):
     PATH_BASE = "/org/bluez/example/service"
 
-    def __init__(self, index, uuid, primary):
-        self.bus = BleTools.get_bus()
+    def __init__(self, index, uuid, primary, context=None):
+        # Services are exported on the application's connection, so they
+        # must be given the context the Application was created with.
+        self.context = context or BleContext.default()
+        self.bus = self.context.bus
         self.path = self.PATH_BASE + str(index)
         self.uuid = uuid
         self.primary = primary
         self.characteristics = []
         self.next_index = 0
+        self.application = None
+        self._properties = None
         dbus.service.Object.__init__(self, self.bus, self.path)
 
     def get_properties(self):
+        # Cached; callers must not modify the returned dictionary.
+        if self._properties is None:
+            self._properties = self.build_properties()
+        return self._properties
+
+    def invalidate_properties(self):
+        self._properties = None
+        self.invalidate_managed_objects()
+
+    def invalidate_managed_objects(self):
+        if self.application is not None:
+            self.application.invalidate_managed_objects()
+
+    def build_properties(self):
         return {
                 GATT_SERVICE_IFACE: {
                         'UUID': self.uuid,
@@ -107,6 +150,7 @@ class Service(dbus.service.Object):
 
     def add_characteristic(self, characteristic):
         self.characteristics.append(characteristic)
+        self.invalidate_properties()
 
     def get_characteristic_paths(self):
         result = []
@@ -139,23 +183,45 @@ class Characteristic(dbus.service.Object):
     """
     org.bluez.GattCharacteristic1 interface implementation
     """
-    def __init__(self, uuid, flags, service):
+    def __init__(self, uuid, flags, service, encoder=None):
         index = service.get_next_index()
         self.path = service.path + '/char' + str(index)
+        self.context = service.context
         self.bus = service.get_bus()
         self.uuid = uuid
         self.service = service
-        self.flags = flags
+        self.encoder = encoder or ValueEncoder()
         self.descriptors = []
         self.next_index = 0
+        self._properties = None
+        self.flags = flags
         dbus.service.Object.__init__(self, self.bus, self.path)
 
+    @property
+    def flags(self):
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        self._flags = flags
+        self.invalidate_properties()
+
     def get_properties(self):
+        # Cached; callers must not modify the returned dictionary.
+        if self._properties is None:
+            self._properties = self.build_properties()
+        return self._properties
+
+    def invalidate_properties(self):
+        self._properties = None
+        self.service.invalidate_managed_objects()
+
+    def build_properties(self):
         return {
                 GATT_CHRC_IFACE: {
                         'Service': self.service.get_path(),
                         'UUID': self.uuid,
-                        'Flags': self.flags,
+                        'Flags': self._flags,
                         'Descriptors': dbus.Array(
                                 self.get_descriptor_paths(),
                                 signature='o')
@@ -167,6 +233,7 @@ class Characteristic(dbus.service.Object):
 
     def add_descriptor(self, descriptor):
         self.descriptors.append(descriptor)
+        self.invalidate_properties()
 
     def get_descriptor_paths(self):
         result = []
@@ -177,6 +244,18 @@ class Characteristic(dbus.service.Object):
     def get_descriptors(self):
         return self.descriptors
 
+    def read_value(self, value, options):
+        # Long reads arrive as repeated ReadValue calls with an offset.
+        if value is None:
+            return dbus.ByteArray(b"")
+        payload = b"".join(self.encoder.payloads(value))
+        return dbus.ByteArray(payload[options.get('offset', 0):])
+
+    def send_value(self, value):
+        # dbus.ByteArray marshals straight from the bytes buffer as 'ay'.
+        for payload in self.encoder.payloads(value):
+            self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": dbus.ByteArray(payload)}, [])
+
     @dbus.service.method(DBUS_PROP_IFACE,
                          in_signature='s',
                          out_signature='a{sv}')
@@ -190,22 +269,22 @@ class Characteristic(dbus.service.Object):
                         in_signature='a{sv}',
                         out_signature='ay')
     def ReadValue(self, options):
-        print('Default ReadValue called, returning error')
+        log.warning('Default ReadValue called, returning error')
         raise NotSupportedException()
 
     @dbus.service.method(GATT_CHRC_IFACE, in_signature='aya{sv}')
     def WriteValue(self, value, options):
-        print('Default WriteValue called, returning error')
+        log.warning('Default WriteValue called, returning error')
         raise NotSupportedException()
 
     @dbus.service.method(GATT_CHRC_IFACE)
     def StartNotify(self):
-        print('Default StartNotify called, returning error')
+        log.warning('Default StartNotify called, returning error')
         raise NotSupportedException()
 
     @dbus.service.method(GATT_CHRC_IFACE)
     def StopNotify(self):
-        print('Default StopNotify called, returning error')
+        log.warning('Default StopNotify called, returning error')
         raise NotSupportedException()
 
     @dbus.service.signal(DBUS_PROP_IFACE,
@@ -233,17 +312,38 @@ class Descriptor(dbus.service.Object):
         index = characteristic.get_next_index()
         self.path = characteristic.path + '/desc' + str(index)
         self.uuid = uuid
-        self.flags = flags
         self.chrc = characteristic
+        self.context = characteristic.context
         self.bus = characteristic.get_bus()
+        self._properties = None
+        self.flags = flags
         dbus.service.Object.__init__(self, self.bus, self.path)
 
+    @property
+    def flags(self):
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        self._flags = flags
+        self.invalidate_properties()
+
     def get_properties(self):
+        # Cached; callers must not modify the returned dictionary.
+        if self._properties is None:
+            self._properties = self.build_properties()
+        return self._properties
+
+    def invalidate_properties(self):
+        self._properties = None
+        self.chrc.service.invalidate_managed_objects()
+
+    def build_properties(self):
         return {
                 GATT_DESC_IFACE: {
                         'Characteristic': self.chrc.get_path(),
                         'UUID': self.uuid,
-                        'Flags': self.flags,
+                        'Flags': self._flags,
                 }
         }
 
@@ -263,12 +363,12 @@ class Descriptor(dbus.service.Object):
                         in_signature='a{sv}',
                         out_signature='ay')
     def ReadValue(self, options):
-        print ('Default ReadValue called, returning error')
+        log.warning('Default ReadValue called, returning error')
         raise NotSupportedException()
 
     @dbus.service.method(GATT_DESC_IFACE, in_signature='aya{sv}')
     def WriteValue(self, value, options):
-        print('Default WriteValue called, returning error')
+        log.warning('Default WriteValue called, returning error')
         raise NotSupportedException()
 
 
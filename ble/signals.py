@@ -0,0 +1,108 @@
+import dbus
+
+from ble.service import Service, Characteristic, Descriptor
+from ble.notifier import NotificationScheduler
+from ble.payload import ValueEncoder, value_format
+from canbus.queues import COALESCE
+
+UUID_SUFFIX = "-710e-4a5b-8d75-3e5b444bc3cf"
+FIRST_SIGNAL_UUID = 0x1000
+
+
+def signal_encoder(signal):
+    # Sized from the decoded (physical) range, so scale and offset are
+    # accounted for; non-integer scales or offsets decode to floats.
+    scale, offset = signal.scale, signal.offset
+    is_float = signal.is_float or scale != int(scale) or offset != int(offset)
+    return ValueEncoder(value_format(*signal.physical_range(), is_float))
+
+
+class SignalService(Service):
+    """
+    Exposes every signal in a canbus.signals.SignalDatabase as a notify
+    characteristic subscribed to that signal's (can_id, module, key).
+    """
+    SIGNAL_SVC_UUID = "00000002" + UUID_SUFFIX
+
+    def __init__(self, index, can_handler, database, notifier=None, context=None):
+        self.can_handler = can_handler
+        self.database = database
+        self.notifier = notifier or NotificationScheduler()
+        Service.__init__(self, index, self.SIGNAL_SVC_UUID, True, context)
+
+        for number, (message, signal) in enumerate(database.signals()):
+            uuid = signal.uuid or f"{FIRST_SIGNAL_UUID + number:08x}{UUID_SUFFIX}"
+            self.add_characteristic(SignalCharacteristic(self, message, signal, uuid))
+        self.add_characteristic(SnapshotCharacteristic(self))
+
+    def get_signal_characteristics(self):
+        return [chrc for chrc in self.characteristics if isinstance(chrc, SignalCharacteristic)]
+
+
+class SignalCharacteristic(Characteristic):
+    def __init__(self, service, message, signal, uuid):
+        self.notifying = False
+        self.message = message
+        self.signal = signal
+        self.cache_key = (message.can_id, signal.module, signal.key)
+
+        Characteristic.__init__(self, uuid, ["read", "notify"], service, signal_encoder(signal))
+        self.add_descriptor(SignalDescriptor(self, signal.name if signal.unit is None
+                                             else f"{signal.name} ({signal.unit})"))
+
+    def ReadValue(self, options):
+        return self.read_value(self.service.can_handler.cache.get(self.cache_key), options)
+
+    def StartNotify(self):
+        if self.notifying:
+            return False
+
+        self.notifying = True
+
+        self.service.can_handler.add_subscriber(
+            self, self.message.can_id, self.signal.module, self.signal.key, policy=COALESCE)
+
+        return True
+
+    def StopNotify(self):
+        if not self.notifying:
+            return
+        self.notifying = False
+        self.service.can_handler.remove_subscriber(self)
+        self.service.notifier.cancel(self)
+
+    def notify(self, value):
+        if self.notifying:
+            self.service.notifier.update(self, value)
+
+
+class SnapshotCharacteristic(Characteristic):
+    """
+    Reads the cached value of every signal at once, packed with each
+    signal's encoder in characteristic order. Signals not yet received read
+    as zero.
+    """
+    SNAPSHOT_CHARACTERISTIC_UUID = "00000003" + UUID_SUFFIX
+
+    def __init__(self, service):
+        Characteristic.__init__(self, self.SNAPSHOT_CHARACTERISTIC_UUID, ["read"], service)
+        self.add_descriptor(SignalDescriptor(self, "Snapshot of all signals"))
+
+    def ReadValue(self, options):
+        cache = self.service.can_handler.cache
+        payload = b"".join(
+            b"".join(chrc.encoder.payloads(cache.get(chrc.cache_key, 0)))
+            for chrc in self.service.get_signal_characteristics()
+        )
+        return dbus.ByteArray(payload[options.get('offset', 0):])
+
+
+class SignalDescriptor(Descriptor):
+    SIGNAL_DESCRIPTOR_UUID = "2901"
+
+    def __init__(self, characteristic, description):
+        self.value = dbus.ByteArray(description.encode())
+        Descriptor.__init__(self, self.SIGNAL_DESCRIPTOR_UUID, ["read"], characteristic)
+
+    def ReadValue(self, options):
+        return self.value
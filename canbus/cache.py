@@ -0,0 +1,64 @@
+import time
+from array import array
+
+DEFAULT_CAPACITY = 256
+
+
+class LastValueCache:
+    """
+    Latest value per (can_id, module_id, key), updated in place on the
+    receive path. Each key gets a fixed slot in preallocated value and
+    timestamp arrays the first time it is seen, so updates only store into
+    existing slots. Reads are plain lookups and never touch the bus.
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.slots = {}
+        self.values = [None] * capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.updates = 0
+        # Most recent frame of any key.
+        self.last = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _add(self, frame_key):
+        index = len(self.slots)
+        if index == len(self.values):
+            self.values.extend([None] * index)
+            self.timestamps.extend(array('d', bytes(8 * index)))
+        self.slots[frame_key] = index
+        return index
+
+    def update(self, frames, timestamp=None):
+        if not frames:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+
+        slots = self.slots
+        values = self.values
+        timestamps = self.timestamps
+        for frame in frames:
+            frame_key = frame[:3]
+            index = slots.get(frame_key)
+            if index is None:
+                index = self._add(frame_key)
+                values = self.values
+                timestamps = self.timestamps
+            values[index] = frame[3]
+            timestamps[index] = timestamp
+        self.updates += len(frames)
+        self.last = frames[-1]
+
+    def get(self, frame_key, default=None):
+        index = self.slots.get(frame_key)
+        return default if index is None else self.values[index]
+
+    def timestamp(self, frame_key):
+        index = self.slots.get(frame_key)
+        return None if index is None else self.timestamps[index]
+
+    def snapshot(self):
+        values = self.values
+        return {frame_key: values[index] for frame_key, index in self.slots.items()}
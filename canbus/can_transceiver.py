@@ -1,11 +1,19 @@
+import asyncio
+import logging
+
 from canbus.handler import CANHandler
+from canbus.log import RateLimiter, configure as configure_logging
+
+log = logging.getLogger(__name__)
 
 class CANMessageSubscriber:
     def __init__(self, can_handler):
         self.can_handler = can_handler
+        self.log_limiter = RateLimiter(1)
 
     def notify(self, count_value):
-        print("Received message - Value:", count_value)
+        if log.isEnabledFor(logging.INFO) and self.log_limiter.allow():
+            log.info("Received message - Value: %s", count_value)
         # self.can_handler.send_can_message(0x01, count_value)
 
 def main():
@@ -16,7 +24,8 @@ def main():
     subscriber = CANMessageSubscriber(can_handler)
 
     can_handler.add_subscriber(subscriber)
-    can_handler.receive_can_message()
+    asyncio.run(can_handler.receive_can_message())
 
 if __name__ == "__main__":
+    configure_logging()
     main()
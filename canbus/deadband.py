@@ -0,0 +1,100 @@
+import itertools
+import time
+
+
+class ChangeRule:
+    """
+    An update is forwarded when it differs from the last forwarded value by
+    more than the configured bands and at least min_interval seconds have
+    passed since that value. With no bands set, any change is forwarded.
+    """
+    def __init__(self, absolute=None, relative=None, min_interval=None):
+        self.absolute = absolute
+        self.relative = relative
+        self.min_interval = min_interval
+
+    def changed(self, value, previous):
+        delta = abs(value - previous)
+        if self.absolute is not None and delta <= self.absolute:
+            return False
+        if self.relative is not None and delta <= self.relative * abs(previous):
+            return False
+        return value != previous
+
+
+class ChangeFilter:
+    """
+    Drops repeated and near-identical updates before they are fanned out to
+    subscribers. Rules are set per (can_id, module_id, key) pattern, with
+    None matching anything; keys without a matching rule use the default
+    rule, or are always forwarded if it is None.
+    """
+    def __init__(self, default=None):
+        self.default = default
+        self.forwarded = 0
+        self.suppressed = 0
+        self._rules = {}
+        self._resolved = {}
+        # Frame key -> [last forwarded value, its time, forwarded, suppressed]
+        self._keys = {}
+
+    def set_rule(self, rule, can_id=None, module_id=None, key=None):
+        self._rules[(can_id, module_id, key)] = rule
+        self._resolved.clear()
+
+    def _rule(self, frame_key):
+        if frame_key in self._resolved:
+            return self._resolved[frame_key]
+        # Exact fields are preferred over wildcards, can_id first.
+        can_id, module_id, key = frame_key
+        rule = self.default
+        for pattern in itertools.product((can_id, None), (module_id, None), (key, None)):
+            if pattern in self._rules:
+                rule = self._rules[pattern]
+                break
+        self._resolved[frame_key] = rule
+        return rule
+
+    def apply(self, frames):
+        now = time.monotonic()
+        keys = self._keys
+        forwarded = []
+        for frame in frames:
+            frame_key = frame[:3]
+            rule = self._rule(frame_key)
+            if rule is None:
+                forwarded.append(frame)
+                continue
+
+            value = frame[3]
+            state = keys.get(frame_key)
+            if state is None:
+                keys[frame_key] = [value, now, 1, 0]
+                forwarded.append(frame)
+            elif ((rule.min_interval is None or now - state[1] >= rule.min_interval)
+                    and rule.changed(value, state[0])):
+                state[0] = value
+                state[1] = now
+                state[2] += 1
+                forwarded.append(frame)
+            else:
+                state[3] += 1
+
+        self.suppressed += len(frames) - len(forwarded)
+        self.forwarded += len(forwarded)
+        return forwarded
+
+    def stats(self):
+        return {
+            "forwarded": self.forwarded,
+            "suppressed": self.suppressed,
+            "keys": {
+                frame_key: {"forwarded": state[2], "suppressed": state[3]}
+                for frame_key, state in self._keys.items()
+            },
+        }
+
+    def reset(self):
+        self.forwarded = 0
+        self.suppressed = 0
+        self._keys.clear()
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+from canbus.queues import SubscriberQueue, DEFAULT_QUEUE_SIZE, DROP_OLDEST, BLOCK
+from canbus.routing import RoutingTable
+from canbus.cache import LastValueCache
+from canbus import tracing
+from canbus.log import RateLimiter
+
+log = logging.getLogger(__name__)
+# Per-frame debug output is sampled to this many lines per second.
+FRAME_LOG_RATE = 10
+
+class FrameDispatcher:
+    """
+    Routing, last-value cache and subscriber queues for decoded
+    (can_id, module_id, key, value) frames, whatever they are read from.
+    Base of canbus.handler.CANHandler and canbus.ring.RingHandler.
+    """
+    def __init__(self, signals=None, cache=None, change_filter=None):
+        # Optional canbus.signals.SignalDatabase replacing the fixed
+        # module/key/value payload layout.
+        self.signals = signals
+        # Subscriber -> SubscriberQueue feeding that subscriber's consumer task.
+        self.subscribers = {}
+        self.routes = RoutingTable()
+        # Last value per key for reads; may be shared between handlers.
+        self.cache = cache if cache is not None else LastValueCache()
+        # Optional canbus.deadband.ChangeFilter applied before fan-out.
+        self.change_filter = change_filter
+        self._frame_log_limiter = RateLimiter(FRAME_LOG_RATE)
+
+    def _update_demand(self):
+        # Called whenever subscriptions change.
+        pass
+
+    def _dispatch_traced(self, decode, data):
+        # Decode and dispatch for paths that do not read the socket
+        # themselves; the receive stage is not seen here.
+        tracer = tracing.tracer
+        start = tracer.now()
+        batch = decode(data)
+        tracer.record(tracing.DECODE, start)
+        tracer.mark_received(batch, start)
+        blocked = self._dispatch_batch(batch)
+        tracer.record_frames(tracing.DISPATCH, batch, start)
+        return blocked
+
+    def _dispatch_batch(self, batch):
+        # Frames only reach the queues whose subscription matches them. Each
+        # queue applies its own bound and drop policy; the queues that are
+        # full under the 'block' policy are returned so the caller can stop
+        # reading.
+        if log.isEnabledFor(logging.DEBUG) and batch and self._frame_log_limiter.allow():
+            log.debug("Received %d CAN frames, first: can_id=%#x module=%d key=%d value=%s",
+                      len(batch), *batch[0])
+
+        # The cache always sees the latest value; subscribers only see
+        # updates that pass the change filter.
+        self.cache.update(batch)
+        if self.change_filter is not None:
+            batch = self.change_filter.apply(batch)
+
+        blocked = []
+        lookup = self.routes.lookup
+        for frame in batch:
+            for queue in lookup(frame[:3]):
+                queue.put(frame)
+                if queue.policy == BLOCK and queue.full and queue not in blocked:
+                    blocked.append(queue)
+        return blocked
+
+    def add_subscriber(self, subscriber, can_id=None, module_id=None, key=None,
+                       maxsize=DEFAULT_QUEUE_SIZE, policy=DROP_OLDEST):
+        log.info("New subscriber %r", subscriber)
+        if subscriber in self.subscribers:
+            self.remove_subscriber(subscriber)
+        queue = SubscriberQueue(subscriber, maxsize, policy)
+        self.subscribers[subscriber] = queue
+        self.routes.add(queue, can_id, module_id, key)
+        self._update_demand()
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Consumers are started by receive_can_message.
+            return
+        queue.start()
+
+    def remove_subscriber(self, subscriber):
+        self.routes.remove(subscriber)
+        self.subscribers.pop(subscriber).stop()
+        self._update_demand()
+
+    def start_subscribers(self):
+        for queue in self.subscribers.values():
+            queue.start()
+
+    def stop_subscribers(self):
+        for queue in self.subscribers.values():
+            queue.stop()
+
+    def subscriber_stats(self):
+        return {subscriber: queue.stats() for subscriber, queue in self.subscribers.items()}
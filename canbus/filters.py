@@ -0,0 +1,110 @@
+import ctypes
+import socket
+import struct
+
+CAN_MTU = 16
+CAN_SFF_MASK = 0x7FF
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_EFF_FLAG = 0x80000000
+
+# Not exported by the socket module on every Python build.
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+# Classic BPF opcodes used by the module program.
+BPF_LDB_ABS = 0x30
+BPF_JEQ_K = 0x15
+BPF_JGE_K = 0x35
+BPF_RET_K = 0x06
+BPF_ACCEPT = 0xFFFFFFFF
+BPF_REJECT = 0
+BPF_MAX_MODULES = 250
+
+SOCK_FILTER_STRUCT = struct.Struct("=HBBI")
+SOCK_FPROG_STRUCT = struct.Struct("@HP")
+
+# Offsets into struct can_frame as seen by a socket filter.
+FRAME_LENGTH_OFFSET = 4
+FRAME_DATA_OFFSET = 8
+PAYLOAD_LENGTH = 6
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, int):
+        return [value]
+    return list(value)
+
+
+def compile_id_filters(can_ids, can_mask=None):
+    """
+    Build the python-can filter list that socketcan installs as the kernel
+    CAN_RAW_FILTER set. Entries are either an ID, matched under can_mask, or
+    an explicit (can_id, can_mask) pair. An empty list accepts every frame.
+    Without can_mask, IDs are matched exactly: 11-bit IDs under
+    CAN_SFF_MASK and 29-bit IDs under CAN_EFF_MASK.
+    """
+    filters = []
+    for rule in _as_list(can_ids):
+        if isinstance(rule, tuple):
+            can_id, mask = rule
+        elif can_mask is not None:
+            can_id, mask = rule, can_mask
+        else:
+            can_id = rule
+            mask = CAN_EFF_MASK if can_id > CAN_SFF_MASK else CAN_SFF_MASK
+        filters.append({
+            "can_id": can_id,
+            "can_mask": mask,
+            "extended": can_id > CAN_SFF_MASK,
+        })
+    return filters
+
+
+def compile_module_program(module_ids):
+    """
+    Assemble a classic BPF program that accepts frames carrying a full
+    module/key/value payload whose first data byte is one of module_ids.
+    """
+    module_ids = sorted(set(_as_list(module_ids)))
+    if not module_ids or len(module_ids) > BPF_MAX_MODULES:
+        raise ValueError(f"Cannot compile module filter for {len(module_ids)} modules")
+
+    count = len(module_ids)
+    program = [
+        (BPF_LDB_ABS, 0, 0, FRAME_LENGTH_OFFSET),
+        (BPF_JGE_K, 0, count + 1, PAYLOAD_LENGTH),
+        (BPF_LDB_ABS, 0, 0, FRAME_DATA_OFFSET),
+    ]
+    for index, module_id in enumerate(module_ids):
+        program.append((BPF_JEQ_K, count - index, 0, module_id))
+    program.append((BPF_RET_K, 0, 0, BPF_REJECT))
+    program.append((BPF_RET_K, 0, 0, BPF_ACCEPT))
+
+    return b"".join(SOCK_FILTER_STRUCT.pack(*instruction) for instruction in program)
+
+
+def attach_module_program(sock, module_ids):
+    program = compile_module_program(module_ids)
+    buffer = ctypes.create_string_buffer(program, len(program))
+    fprog = SOCK_FPROG_STRUCT.pack(len(program) // SOCK_FILTER_STRUCT.size, ctypes.addressof(buffer))
+    # The kernel copies the program during setsockopt, so the buffer only
+    # needs to outlive this call.
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+def detach_program(sock):
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
+    except OSError:
+        # ENOENT when no program is attached.
+        pass
+
+
+def module_predicate(module_ids):
+    """
+    User-space fallback for when a socket filter cannot be attached: a
+    prebuilt set membership test applied to the decoded module byte.
+    """
+    return frozenset(_as_list(module_ids)).__contains__
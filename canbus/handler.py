@@ -1,36 +1,170 @@
 import can
+import socket
+import time
+import logging
+import struct
 import asyncio
 
+from canbus.filters import (CAN_MTU, CAN_EFF_MASK, CAN_EFF_FLAG, PAYLOAD_LENGTH,
+                            compile_id_filters, attach_module_program, detach_program,
+                            module_predicate)
+from canbus.sender import FrameSender
+from canbus.scheduler import SendScheduler, CONTROL
+from canbus.dispatch import FrameDispatcher
+from canbus.health import (BusHealth, ANCILLARY_SIZE, parse_ancillary, set_receive_buffer,
+                           enable_drop_counter, enable_hardware_timestamps)
+from canbus import tracing
+
 NOTIFY_TIMEOUT = 1000
+RECV_TIMEOUT = 1
+
+# Layout of a classic struct can_frame as read from a raw socketcan socket:
+# 4 byte host-order can_id, 1 byte length, 3 bytes padding, 8 data bytes.
+# Our payload is 1 byte module, 1 byte key and a 4 byte big-endian value.
+FRAME_ID_STRUCT = struct.Struct("=I12x")
+FRAME_PAYLOAD_STRUCT = struct.Struct(">4xB3xBBI2x")
+FRAME_DATA_STRUCT = struct.Struct("=IB3x8s")
+MAX_BATCH = 256
+
+log = logging.getLogger(__name__)
 
-class CANHandler:
-    def __init__(self, interface='can0', bitrate=100000, can_id=None, module_id=None):
-        self.bus = can.interface.Bus(interface, bustype='socketcan', bitrate=bitrate)
+class CANHandler(FrameDispatcher):
+    def __init__(self, interface='can0', bitrate=100000, can_id=None, module_id=None, native_receive=True, batch_receive=True,
+                 signals=None, cache=None, change_filter=None, demand_driven=True, rcvbuf=None,
+                 bustype='socketcan'):
+        self.bus = can.interface.Bus(interface, bustype=bustype, bitrate=bitrate)
         self.can_id = can_id
         self.module_id = module_id
-        self.subscribers = set()
+        self.native_receive = native_receive
+        self.batch_receive = batch_receive
+        FrameDispatcher.__init__(self, signals, cache, change_filter)
+        # Callables taking (timestamp, frames) where frames is a buffer of
+        # raw struct can_frames, e.g. canbus.recorder.FrameRecorder.write.
+        self.raw_subscribers = []
         self._stop_flag = False
+        self._loop = None
+        self._receiving = None
+        self._reader_fileno = -1
+        self._resume_task = None
+        self._socket = getattr(self.bus, 'socket', None)
+        self._batch_buffer = bytearray(CAN_MTU * MAX_BATCH)
+        self._batch_view = memoryview(self._batch_buffer)
+        self._accept_module = None
+        # With demand_driven set, the kernel filters follow the subscribed
+        # IDs and the reader is parked while nothing is subscribed. Parked
+        # or filtered-out frames never reach the cache, so handlers whose
+        # cache is read directly (e.g. by GATT reads) should turn it off.
+        self.demand_driven = demand_driven
+        self._parked = False
+        self._demand = asyncio.Event()
+        self._filter_ids = None
+        self._can_mask = None
+        self.sender = FrameSender(self.bus)
+        self.health = BusHealth(interface, bitrate)
+        if self._socket is not None:
+            self._configure_socket(rcvbuf)
+        # Non-blocking, prioritised sends; see schedule(). The scheduler
+        # thread gets its own FrameSender, whose preallocated frames are
+        # never touched by send_can_message on the loop thread.
+        self.scheduler = SendScheduler(FrameSender(self.bus))
 
         if can_id is not None or module_id is not None:
             self.set_filters(can_id, module_id)
 
-    def set_filters(self, can_id=None, module_id=None):
-        filters = []
+    def _configure_socket(self, rcvbuf):
+        if rcvbuf is not None:
+            self.health.receive_buffer = set_receive_buffer(self._socket, rcvbuf)
+        else:
+            self.health.receive_buffer = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        # Ancillary data is only read by the batch path; python-can's own
+        # recv expects a single timestamp message.
+        if self.native_receive and self.batch_receive:
+            enable_drop_counter(self._socket)
+            self.health.hardware_timestamps_requested = enable_hardware_timestamps(self._socket)
+
+    def set_filters(self, can_id=None, module_id=None, can_mask=None):
+        # IDs go into the kernel CAN_RAW_FILTER set. The module lives in the
+        # payload, so it is matched by a socket filter program when the bus
+        # exposes a raw socket, or by a prebuilt predicate otherwise.
+        self._filter_ids = can_id
+        self._can_mask = can_mask
+        self._apply_id_filters()
+
+        self._accept_module = None
+        if self._socket is not None:
+            detach_program(self._socket)
+
+        if module_id is None:
+            return
+
+        if self._socket is not None:
+            try:
+                attach_module_program(self._socket, module_id)
+                return
+            except (OSError, ValueError) as e:
+                log.warning("Kernel module filter unavailable, filtering in Python: %s", e)
+
+        self._accept_module = module_predicate(module_id)
+
+    def _apply_id_filters(self):
+        if self._parked and self._socket is not None:
+            # An empty CAN_RAW_FILTER set makes the kernel drop every frame.
+            self._socket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER, b"")
+            return
+        can_ids = self._filter_ids
+        if can_ids is None and self.demand_driven:
+            can_ids = self._subscribed_ids()
+        self.bus.set_filters(compile_id_filters(can_ids, self._can_mask))
+
+    def _subscribed_ids(self):
+        # None when some subscriber takes every ID.
+        if self.raw_subscribers:
+            return None
+        can_ids = {pattern[0] for pattern in self.routes.patterns()}
+        if None in can_ids:
+            return None
+        return sorted(can_ids)
 
-        if can_id is not None:
-            filters.append({"can_id": can_id, "can_mask": 0x7FF, "extended": False})
+    def _update_demand(self):
+        if not self.demand_driven:
+            return
+        if self.subscribers or self.raw_subscribers:
+            if self._parked:
+                self._unpark()
+            elif self._filter_ids is None:
+                self._apply_id_filters()
+        elif not self._parked:
+            self._park()
 
-        if module_id is not None:
-            filters.append({"can_id": 0, "can_mask": 0, "extended": False, "data": [module_id]})
+    def _park(self):
+        log.info("No subscribers, parking CAN reader")
+        self._parked = True
+        self._demand.clear()
+        self._apply_id_filters()
+        if self._receiving is not None:
+            self._loop.remove_reader(self._reader_fileno)
 
-        self.bus.set_filters(filters)
+    def _unpark(self):
+        log.info("Subscriber added, resuming CAN reader")
+        self._parked = False
+        self._apply_id_filters()
+        if self._receiving is not None and self._resume_task is None:
+            self._loop.add_reader(self._reader_fileno, self._on_readable)
+        self._demand.set()
 
     def send_can_message(self, key, value):
-        key_bytes = key.to_bytes(1, byteorder='big')
-        value_bytes = value.to_bytes(4, byteorder='big')
-        data = self.module_id.to_bytes(1, byteorder='big') + key_bytes + value_bytes
-        message = can.Message(arbitration_id=self.can_id, data=data, is_extended_id=False)
-        self.bus.send(message)
+        self.sender.send(self.can_id, self.module_id, key, value)
+
+    def send_many(self, items):
+        return self.sender.send_many(self.can_id, self.module_id, items)
+
+    def schedule(self, key, value, priority=CONTROL, can_id=None, module_id=None):
+        # Queue a send for the scheduler thread and return immediately.
+        can_id = self.can_id if can_id is None else can_id
+        module_id = self.module_id if module_id is None else module_id
+        if can_id is None or module_id is None:
+            raise ValueError("No CAN ID or module ID to send to")
+        self.scheduler.put(can_id, module_id, key, value, priority)
 
     def read_can_message(self, message):
         can_id = message.arbitration_id
@@ -40,30 +174,253 @@ class CANHandler:
         value = int.from_bytes(data[2:6], byteorder='big')
         return can_id, target_module, key, value
 
+    def _publish_raw(self, message):
+        can_id = message.arbitration_id
+        if message.is_extended_id:
+            can_id |= CAN_EFF_FLAG
+        frame = FRAME_DATA_STRUCT.pack(can_id, message.dlc, bytes(message.data))
+        self._publish_frames(message.timestamp, frame)
+
+    def decode_message(self, message):
+        if self.raw_subscribers:
+            self._publish_raw(message)
+
+        if self.signals is not None:
+            return self.signals.decode(message.arbitration_id, message.data) or []
+
+        frame = self.read_can_message(message)
+        if self._accept_module is not None and not self._accept_module(frame[1]):
+            return []
+        return [frame]
+
+    def read_signal_messages(self, buffer):
+        # One dict lookup and one precompiled decoder call per frame.
+        decoders = self.signals.decoders
+        frames = []
+        for can_id, length, data in FRAME_DATA_STRUCT.iter_unpack(buffer):
+            decoder = decoders.get(can_id & CAN_EFF_MASK)
+            if decoder is not None and length >= decoder[0]:
+                frames.extend(decoder[1](data))
+        return frames
+
+    def read_can_messages(self, buffer):
+        if self.signals is not None:
+            return self.read_signal_messages(buffer)
+
+        # Both passes run over the same contiguous buffer in C; frames too
+        # short to carry a module/key/value payload are dropped.
+        ids = FRAME_ID_STRUCT.iter_unpack(buffer)
+        payloads = FRAME_PAYLOAD_STRUCT.iter_unpack(buffer)
+        accept = self._accept_module
+        if accept is None:
+            return [
+                (can_id & CAN_EFF_MASK, target_module, key, value)
+                for (can_id,), (length, target_module, key, value) in zip(ids, payloads)
+                if length >= PAYLOAD_LENGTH
+            ]
+        return [
+            (can_id & CAN_EFF_MASK, target_module, key, value)
+            for (can_id,), (length, target_module, key, value) in zip(ids, payloads)
+            if length >= PAYLOAD_LENGTH and accept(target_module)
+        ]
+
+    def drain(self):
+        if self._socket is None:
+            batch = []
+            for _ in range(MAX_BATCH):
+                message = self.bus.recv(timeout=0)
+                if message is None:
+                    break
+                batch.extend(self.decode_message(message))
+            return batch
+
+        return self.read_can_messages(self._read_frames())
+
+    def _read_frames(self):
+        # The first frame brings the kernel drop counter and receive
+        # timestamp with it; the rest are read without ancillary data.
+        view = self._batch_view
+        try:
+            received, ancdata, _, _ = self._socket.recvmsg_into([view[:CAN_MTU]], ANCILLARY_SIZE,
+                                                                socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return view[:0]
+        timestamp, drops, hardware = parse_ancillary(ancdata)
+
+        recv_into = self._socket.recv_into
+        offset = CAN_MTU if received == CAN_MTU else 0
+        end = len(view)
+        while offset < end:
+            try:
+                received = recv_into(view[offset:offset + CAN_MTU], CAN_MTU, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            if received == CAN_MTU:
+                offset += CAN_MTU
+
+        self.health.received(offset // CAN_MTU, drops,
+                             None if timestamp is None else "hardware" if hardware else "software")
+        frames = view[:offset]
+        if offset and self.raw_subscribers:
+            # Frames drained in one wake-up share the first one's receive time.
+            self._publish_frames(timestamp or time.time(), frames)
+        return frames
+
+    def _drain_traced(self, tracer):
+        start = tracer.now()
+        if self._socket is None:
+            batch = self.drain()
+            tracer.record(tracing.RECEIVE, start)
+        else:
+            frames = self._read_frames()
+            tracer.record(tracing.RECEIVE, start)
+            batch = self.read_can_messages(frames)
+        tracer.record(tracing.DECODE, start)
+        tracer.mark_received(batch, start)
+        return batch, start
+
+    def _publish_frames(self, timestamp, frames):
+        for raw_subscriber in self.raw_subscribers:
+            raw_subscriber(timestamp, frames)
+
+    def feed(self, frames, timestamp=None):
+        # Push a buffer of raw can_frames through the same path as frames
+        # drained from the socket, e.g. from canbus.replay. Returns the
+        # queues that are full under the 'block' policy.
+        if self.raw_subscribers:
+            self._publish_frames(time.time() if timestamp is None else timestamp, frames)
+        if tracing.tracer.enabled:
+            return self._dispatch_traced(self.read_can_messages, frames)
+        return self._dispatch_batch(self.read_can_messages(frames))
+
+    def fileno(self):
+        # Buses without a pollable socket (e.g. 'virtual') fall back to the
+        # threaded receive loop.
+        try:
+            return self.bus.fileno()
+        except NotImplementedError:
+            return -1
+
     async def receive_can_message(self):
-        print("Starting CAN message receiving loop.")
-        while True:
+        # Runs until stop() is called.
+        log.info("Starting CAN message receiving loop")
+        self._loop = asyncio.get_running_loop()
+        self.start_subscribers()
+        self._update_demand()
+        error_socket = self.health.open_error_socket() if self._socket is not None else None
+        if error_socket is not None:
+            self._loop.add_reader(error_socket.fileno(), self.health.read_errors)
+
+        try:
+            fileno = self.fileno()
+            if self.native_receive and fileno >= 0:
+                await self._receive_native(fileno)
+            else:
+                await self._receive_threaded()
+        finally:
+            if error_socket is not None:
+                self._loop.remove_reader(error_socket.fileno())
+                self.health.close_error_socket()
+            self._loop = None
+            self.stop_subscribers()
+        log.info("CAN message receiving loop stopped")
+
+    async def _receive_native(self, fileno):
+        # The socket is watched by the event loop itself, so frames are read
+        # on the loop thread without an executor hop per frame.
+        loop = asyncio.get_running_loop()
+        self._receiving = loop.create_future()
+        self._reader_fileno = fileno
+        if not self._parked:
+            loop.add_reader(fileno, self._on_readable)
+        if self._stop_flag:
+            self._receiving.set_result(None)
+        try:
+            await self._receiving
+        finally:
+            loop.remove_reader(fileno)
+            if self._resume_task is not None:
+                self._resume_task.cancel()
+                self._resume_task = None
+            self._receiving = None
+            self._reader_fileno = -1
+
+    def _on_readable(self):
+        try:
+            tracer = tracing.tracer
+            if self.batch_receive and tracer.enabled:
+                batch, start = self._drain_traced(tracer)
+                blocked = self._dispatch_batch(batch) if batch else None
+                tracer.record_frames(tracing.DISPATCH, batch, start)
+            elif self.batch_receive:
+                batch = self.drain()
+                blocked = self._dispatch_batch(batch) if batch else None
+            else:
+                message = self.bus.recv(timeout=0)
+                blocked = self._handle_message(message) if message else None
+            if blocked:
+                self._pause_reading(blocked)
+        except Exception:
+            log.exception("Error receiving CAN message")
+
+    def _pause_reading(self, blocked):
+        # A full 'block' queue leaves further frames in the kernel socket
+        # buffer until its consumer catches up.
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self._reader_fileno)
+        self._resume_task = loop.create_task(self._resume_reading(blocked))
+
+    async def _resume_reading(self, blocked):
+        for queue in blocked:
+            await queue.wait_for_space()
+        self._resume_task = None
+        if self._receiving is not None and not self._parked:
+            asyncio.get_running_loop().add_reader(self._reader_fileno, self._on_readable)
+
+    async def _receive_threaded(self):
+        while not self._stop_flag:
+            if self._parked:
+                await self._demand.wait()
+                continue
             try:
                 # Run the blocking recv call in a separate thread
-                message = await asyncio.to_thread(self.bus.recv, timeout=1)
+                message = await asyncio.to_thread(self.bus.recv, timeout=RECV_TIMEOUT)
                 if message:
-                    can_id, target_module, key, value = self.read_can_message(message)
-                    print(f"Received CAN message: can_id={can_id}, target_module={target_module}, key={key}, value={value}")
-                    for subscriber in self.subscribers:
-                        asyncio.create_task(subscriber.notify(value))
-                else:
-                    print("No CAN message received within timeout period.")
-            except Exception as e:
-                print(f"Error receiving CAN message: {e}")
-
-    def add_subscriber(self, subscriber):
-        # start
-        print("New subscriber")
-        self.subscribers.add(subscriber)
-
-    def remove_subscriber(self, subscriber):
-        # stop if sub list empty
-        self.subscribers.remove(subscriber)
+                    for queue in self._handle_message(message):
+                        await queue.wait_for_space()
+                elif log.isEnabledFor(logging.DEBUG):
+                    log.debug("No CAN message received within %ss", RECV_TIMEOUT)
+            except Exception:
+                log.exception("Error receiving CAN message")
+
+    def _handle_message(self, message):
+        self.health.received(1, None)
+        if tracing.tracer.enabled:
+            return self._dispatch_traced(self.decode_message, message)
+        return self._dispatch_batch(self.decode_message(message))
+
+    def add_raw_subscriber(self, raw_subscriber):
+        self.raw_subscribers.append(raw_subscriber)
+        self._update_demand()
+
+    def remove_raw_subscriber(self, raw_subscriber):
+        self.raw_subscribers.remove(raw_subscriber)
+        self._update_demand()
+
+    def bus_health(self):
+        # Rates cover the time since the previous call.
+        return self.health.snapshot()
 
     def stop(self):
-        self._stop_flag = True
\ No newline at end of file
+        # Safe from any thread. The native loop returns straight away, the
+        # threaded one once its pending recv times out.
+        self._stop_flag = True
+        self.scheduler.stop()
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._receiving is not None and not self._receiving.done():
+            self._receiving.set_result(None)
+        self._demand.set()
@@ -0,0 +1,231 @@
+"""
+Bus health for a CANHandler: kernel drops, receive timestamps, error frames
+and interface-wide traffic.
+
+Socket options go on the handler's own raw socket. The first frame of
+every drained batch is read with recvmsg_into, which carries the kernel's
+cumulative SO_RXQ_OVFL drop counter and the receive timestamps; the rest of
+the batch keeps the plain recv_into path. Error frames arrive on a
+separate socket that accepts no data frames, so the receive path never
+sees them. Frame and byte rates for the whole bus come from the
+interface's sysfs statistics and cost nothing per frame.
+"""
+import logging
+import socket
+import struct
+import time
+
+from canbus.log import RateLimiter
+
+# Not exported by the socket module on every Python build.
+SO_RCVBUFFORCE = 33
+SO_TIMESTAMPNS = 35
+SO_TIMESTAMPING = 37
+SO_RXQ_OVFL = 40
+
+SOF_TIMESTAMPING_RX_HARDWARE = 1 << 2
+SOF_TIMESTAMPING_RAW_HARDWARE = 1 << 6
+
+CAN_RAW_FILTER = 1
+CAN_RAW_ERR_FILTER = 2
+CAN_ERR_FLAG = 0x20000000
+CAN_ERR_MASK = 0x1FFFFFFF
+CAN_ERR_BUSOFF = 0x040
+ERROR_CLASSES = (
+    (0x001, "tx_timeout"),
+    (0x002, "lost_arbitration"),
+    (0x004, "controller"),
+    (0x008, "protocol"),
+    (0x010, "transceiver"),
+    (0x020, "no_ack"),
+    (CAN_ERR_BUSOFF, "bus_off"),
+    (0x080, "bus_error"),
+    (0x100, "restarted"),
+)
+
+TIMESPEC_STRUCT = struct.Struct("@ll")
+TIMESTAMPING_STRUCT = struct.Struct("@llllll")
+OVERFLOW_STRUCT = struct.Struct("@I")
+ANCILLARY_SIZE = (socket.CMSG_SPACE(TIMESPEC_STRUCT.size) + socket.CMSG_SPACE(TIMESTAMPING_STRUCT.size)
+                  + socket.CMSG_SPACE(OVERFLOW_STRUCT.size))
+ERROR_FRAME_STRUCT = struct.Struct("=I12x")
+
+# Nominal bits of a classic standard frame besides its data, without bit
+# stuffing, so bus load is a lower bound.
+FRAME_OVERHEAD_BITS = 47
+DROP_LOG_RATE = 1
+STATISTICS_PATH = "/sys/class/net/{interface}/statistics/{name}"
+
+log = logging.getLogger(__name__)
+
+
+def set_receive_buffer(sock, size):
+    # SO_RCVBUFFORCE goes past rmem_max but needs CAP_NET_ADMIN. The kernel
+    # doubles the value; the actual size is returned.
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, size)
+    except PermissionError:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+
+def enable_drop_counter(sock):
+    sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+
+
+def enable_hardware_timestamps(sock):
+    # Returns False when the kernel refuses. True only means they were
+    # requested: most CAN drivers, and vcan, never fill them in, and
+    # software timestamps (SO_TIMESTAMPNS, set by python-can) remain.
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPING,
+                        SOF_TIMESTAMPING_RX_HARDWARE | SOF_TIMESTAMPING_RAW_HARDWARE)
+        return True
+    except OSError as e:
+        log.debug("Hardware timestamps unavailable: %s", e)
+        return False
+
+
+def parse_ancillary(ancdata):
+    """
+    Return (timestamp, drops, hardware) from recvmsg ancillary data. The
+    timestamp is the raw hardware one if present, otherwise the kernel
+    software one, or None; hardware says which. drops is the socket's
+    cumulative overflow count or None.
+    """
+    timestamp = drops = None
+    hardware = False
+    for level, kind, data in ancdata:
+        if level != socket.SOL_SOCKET:
+            continue
+        if kind == SO_RXQ_OVFL:
+            drops = OVERFLOW_STRUCT.unpack_from(data)[0]
+        elif kind == SO_TIMESTAMPING and len(data) >= TIMESTAMPING_STRUCT.size:
+            seconds, nanoseconds = TIMESTAMPING_STRUCT.unpack_from(data)[4:]
+            if seconds or nanoseconds:
+                timestamp = seconds + nanoseconds / 1e9
+                hardware = True
+        elif kind == SO_TIMESTAMPNS and not hardware:
+            seconds, nanoseconds = TIMESPEC_STRUCT.unpack_from(data)
+            timestamp = seconds + nanoseconds / 1e9
+    return timestamp, drops, hardware
+
+
+def open_error_socket(interface):
+    # Receives error frames only: an empty data filter, every error class.
+    sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    sock.setsockopt(socket.SOL_CAN_RAW, CAN_RAW_FILTER, b"")
+    sock.setsockopt(socket.SOL_CAN_RAW, CAN_RAW_ERR_FILTER, CAN_ERR_MASK)
+    sock.setblocking(False)
+    sock.bind((interface,))
+    return sock
+
+
+def read_statistic(interface, name):
+    try:
+        with open(STATISTICS_PATH.format(interface=interface, name=name)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+class BusHealth:
+    """
+    Counters for one handler's socket and interface. snapshot() reports
+    rates over the time since the previous snapshot.
+    """
+    def __init__(self, interface, bitrate):
+        self.interface = interface
+        self.bitrate = bitrate
+        self.frames_read = 0
+        self.kernel_drops = 0
+        self.error_frames = 0
+        self.error_classes = {name: 0 for _, name in ERROR_CLASSES}
+        self.hardware_timestamps_requested = False
+        # 'hardware' or 'software' once a timestamped frame has been seen.
+        self.timestamps = None
+        self.receive_buffer = None
+        self.error_socket = None
+        self._drop_limiter = RateLimiter(DROP_LOG_RATE)
+        self._previous = self._sample()
+
+    def received(self, frames, drops, timestamps=None):
+        self.frames_read += frames
+        if timestamps is not None:
+            self.timestamps = timestamps
+        # The kernel only attaches the socket's cumulative drop count once
+        # it is non-zero. It is a uint32; wraps are followed.
+        if drops is None:
+            return
+        new = (drops - self.kernel_drops) & 0xFFFFFFFF
+        if new:
+            self.kernel_drops += new
+            if self._drop_limiter.allow():
+                log.warning("Kernel dropped %d CAN frames on %s (%d total)",
+                            new, self.interface, self.kernel_drops)
+
+    def open_error_socket(self):
+        try:
+            self.error_socket = open_error_socket(self.interface)
+        except OSError as e:
+            log.debug("No error frame socket on %s: %s", self.interface, e)
+        return self.error_socket
+
+    def close_error_socket(self):
+        if self.error_socket is not None:
+            self.error_socket.close()
+            self.error_socket = None
+
+    def read_errors(self):
+        while True:
+            try:
+                frame = self.error_socket.recv(16)
+            except BlockingIOError:
+                return
+            can_id, = ERROR_FRAME_STRUCT.unpack(frame)
+            if not can_id & CAN_ERR_FLAG:
+                continue
+            self.error_frames += 1
+            for flag, name in ERROR_CLASSES:
+                if can_id & flag:
+                    self.error_classes[name] += 1
+            if can_id & CAN_ERR_BUSOFF:
+                log.error("CAN bus %s is bus-off", self.interface)
+
+    def _sample(self):
+        return (time.monotonic(), self.frames_read, self.kernel_drops,
+                read_statistic(self.interface, "rx_packets"),
+                read_statistic(self.interface, "rx_bytes"),
+                read_statistic(self.interface, "rx_dropped"))
+
+    def snapshot(self):
+        sample = self._sample()
+        previous, self._previous = self._previous, sample
+        elapsed = max(sample[0] - previous[0], 1e-9)
+
+        def rate(index):
+            if sample[index] is None or previous[index] is None:
+                return None
+            return (sample[index] - previous[index]) / elapsed
+
+        frames_per_s = rate(3)
+        bytes_per_s = rate(4)
+        bus_load = None
+        if frames_per_s is not None and bytes_per_s is not None and self.bitrate:
+            bus_load = 100 * (frames_per_s * FRAME_OVERHEAD_BITS + bytes_per_s * 8) / self.bitrate
+
+        return {
+            "frames_per_s": frames_per_s,
+            "bytes_per_s": bytes_per_s,
+            "bus_load_percent": bus_load,
+            "read_frames_per_s": rate(1),
+            "kernel_drops": self.kernel_drops,
+            "kernel_drops_per_s": rate(2),
+            "interface_rx_dropped": sample[5],
+            "error_frames": self.error_frames,
+            "error_classes": dict(self.error_classes),
+            "receive_buffer": self.receive_buffer,
+            "timestamps": self.timestamps,
+            "hardware_timestamps": self.timestamps == "hardware",
+            "hardware_timestamps_requested": self.hardware_timestamps_requested,
+        }
@@ -0,0 +1,83 @@
+"""
+Logging setup for the transceivers.
+
+Modules log through the standard logging module with lazy %-style
+arguments, so a disabled level costs one isEnabledFor check and no
+formatting. configure() routes every record through a queue to a
+background thread, so the receive loop never blocks on stdout or the
+journal. Per-frame messages should additionally be gated by a RateLimiter.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+DEFAULT_LEVEL = "INFO"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+QUEUE_SIZE = 10000
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that drops records instead of blocking when the writer
+    falls behind.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimiter:
+    """
+    Token bucket allowing up to rate events per second, with bursts of up to
+    burst events. Events over the limit are counted in suppressed.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.suppressed = 0
+        self._tokens = self.burst
+        self._last = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        self.suppressed += 1
+        return False
+
+
+def configure(level=None, stream=None):
+    """
+    Install the queue-based handler on the root logger and start the writer
+    thread. The level defaults to $CANBUS_LOG_LEVEL or INFO. Returns the
+    QueueListener, which is also stopped at exit.
+    """
+    level = level or os.environ.get("CANBUS_LOG_LEVEL", DEFAULT_LEVEL)
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, writer)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
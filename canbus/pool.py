@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+
+from canbus.filters import CAN_MTU
+from canbus.handler import CANHandler
+
+# Frames are held this long so slower buses can fill in earlier timestamps.
+DEFAULT_MERGE_WINDOW = 0.005
+DEFAULT_MERGE_SIZE = 65536
+
+
+class CANHandlerPool:
+    """
+    One CANHandler per interface, all read by the same event loop. Filters
+    and subscriptions stay per bus; add_subscriber without an interface
+    subscribes on every bus.
+    """
+    def __init__(self, interfaces, bitrate=100000, **handler_options):
+        self.handlers = {
+            interface: CANHandler(interface, bitrate, **handler_options)
+            for interface in interfaces
+        }
+
+    def __getitem__(self, interface):
+        return self.handlers[interface]
+
+    def _selected(self, interface):
+        if interface is None:
+            return self.handlers.values()
+        return [self.handlers[interface]]
+
+    async def receive_can_message(self):
+        await asyncio.gather(*(handler.receive_can_message() for handler in self.handlers.values()))
+
+    def set_filters(self, interface, can_id=None, module_id=None, **options):
+        self.handlers[interface].set_filters(can_id, module_id, **options)
+
+    def add_subscriber(self, subscriber, interface=None, **options):
+        for handler in self._selected(interface):
+            handler.add_subscriber(subscriber, **options)
+
+    def remove_subscriber(self, subscriber, interface=None):
+        for handler in self._selected(interface):
+            if subscriber in handler.subscribers:
+                handler.remove_subscriber(subscriber)
+
+    def subscriber_stats(self):
+        return {interface: handler.subscriber_stats() for interface, handler in self.handlers.items()}
+
+    def merged(self, window=DEFAULT_MERGE_WINDOW, maxsize=DEFAULT_MERGE_SIZE):
+        return MergedStream(self.handlers, window, maxsize)
+
+    def stop(self):
+        for handler in self.handlers.values():
+            handler.stop()
+
+
+class MergedStream:
+    """
+    Async iterator over the raw frames of several handlers in timestamp
+    order, yielding (timestamp, interface, frame). A frame is released once
+    it is older than window, which bounds how late another bus may deliver
+    an earlier frame and still be ordered correctly.
+    """
+    def __init__(self, handlers, window=DEFAULT_MERGE_WINDOW, maxsize=DEFAULT_MERGE_SIZE):
+        self.window = window
+        self.maxsize = maxsize
+        self.received = 0
+        self.dropped = 0
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._subscriptions = []
+        for interface, handler in handlers.items():
+            raw_subscriber = functools.partial(self._on_frames, interface)
+            handler.add_raw_subscriber(raw_subscriber)
+            self._subscriptions.append((handler, raw_subscriber))
+
+    def close(self):
+        for handler, raw_subscriber in self._subscriptions:
+            handler.remove_raw_subscriber(raw_subscriber)
+        self._subscriptions = []
+
+    def _on_frames(self, interface, timestamp, frames):
+        # The handler reuses its buffer, so frames are copied out here.
+        frames = bytes(frames)
+        heap = self._heap
+        sequence = self._sequence
+        for offset in range(0, len(frames), CAN_MTU):
+            if len(heap) >= self.maxsize:
+                heapq.heappop(heap)
+                self.dropped += 1
+            heapq.heappush(heap, (timestamp, next(sequence), interface, frames[offset:offset + CAN_MTU]))
+        self.received += len(frames) // CAN_MTU
+        self._wakeup.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        heap = self._heap
+        while True:
+            if heap:
+                delay = heap[0][0] + self.window - time.time()
+                if delay <= 0:
+                    timestamp, _, interface, frame = heapq.heappop(heap)
+                    return timestamp, interface, frame
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay if heap else None)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,151 @@
+import asyncio
+import collections
+import logging
+
+from canbus import tracing
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+BLOCK = 'block'
+COALESCE = 'coalesce'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK, COALESCE)
+
+DEFAULT_QUEUE_SIZE = 256
+
+log = logging.getLogger(__name__)
+
+
+async def call_subscriber(method, *args):
+    # Subscribers may implement notify either as a coroutine or a plain method.
+    result = method(*args)
+    if asyncio.iscoroutine(result):
+        await result
+
+
+class SubscriberQueue:
+    """
+    Bounded queue of decoded frames feeding one long-lived consumer task for
+    a single subscriber. Frames are (can_id, module_id, key, value) tuples.
+    """
+    def __init__(self, subscriber, maxsize=DEFAULT_QUEUE_SIZE, policy=DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        if maxsize < 1:
+            raise ValueError("Queue size must be at least 1")
+
+        self.subscriber = subscriber
+        self.maxsize = maxsize
+        self.policy = policy
+        self.queued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.delivered = 0
+        # Coalescing keeps the latest frame per (can_id, module_id, key) in
+        # arrival order of the key; the other policies are plain FIFOs.
+        self._items = {} if policy == COALESCE else collections.deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._task = None
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def full(self):
+        return len(self._items) >= self.maxsize
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "depth": len(self._items),
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "delivered": self.delivered,
+        }
+
+    def put(self, frame):
+        items = self._items
+        if self.policy == COALESCE:
+            frame_key = frame[:3]
+            if frame_key in items:
+                self.coalesced += 1
+            elif len(items) >= self.maxsize:
+                del items[next(iter(items))]
+                self.dropped += 1
+            items[frame_key] = frame
+        elif len(items) < self.maxsize:
+            items.append(frame)
+        elif self.policy == DROP_OLDEST:
+            items.popleft()
+            items.append(frame)
+            self.dropped += 1
+        elif self.policy == DROP_NEWEST:
+            self.dropped += 1
+            return
+        else:
+            # BLOCK: the frame is kept and the handler stops reading the
+            # socket until the consumer makes room.
+            items.append(frame)
+
+        self.queued += 1
+        self._ready.set()
+        if self.policy == BLOCK and len(items) >= self.maxsize:
+            self._space.clear()
+
+    def put_many(self, frames):
+        for frame in frames:
+            self.put(frame)
+
+    async def wait_for_space(self):
+        await self._space.wait()
+
+    def _take(self):
+        items = self._items
+        if self.policy == COALESCE:
+            batch = list(items.values())
+            items.clear()
+        elif hasattr(self.subscriber, 'notify_batch'):
+            batch = list(items)
+            items.clear()
+        else:
+            batch = [items.popleft()]
+
+        if not items:
+            self._ready.clear()
+        if len(items) < self.maxsize:
+            self._space.set()
+        return batch
+
+    async def run(self):
+        notify_batch = getattr(self.subscriber, 'notify_batch', None)
+        while True:
+            await self._ready.wait()
+            batch = self._take()
+            try:
+                if notify_batch is not None:
+                    await call_subscriber(notify_batch, batch)
+                elif tracing.tracer.enabled:
+                    tracer = tracing.tracer
+                    for frame in batch:
+                        tracer.current = frame[:3]
+                        await call_subscriber(self.subscriber.notify, frame[3])
+                    tracer.current = None
+                else:
+                    for _, _, _, value in batch:
+                        await call_subscriber(self.subscriber.notify, value)
+            except Exception:
+                log.exception("Error notifying subscriber %r", self.subscriber)
+            self.delivered += len(batch)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Release a reader paused on this queue.
+        self._space.set()
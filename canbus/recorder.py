@@ -0,0 +1,227 @@
+"""
+Binary CAN traffic recorder.
+
+Frames are appended as fixed-size records to preallocated, memory-mapped
+segment files that rotate when full. Each record is a float64 receive
+timestamp followed by the raw 16 byte struct can_frame (host-order can_id,
+length, 3 padding bytes, 8 data bytes). A segment starts with a 64 byte
+header holding the record count, and every INDEX_INTERVAL records the
+(timestamp, record number) pair is added to a sidecar .idx file so a time
+can be located without scanning.
+
+A recorder continues numbering after the segments already in its
+directory, so a restart never overwrites an earlier capture. With
+max_segments set, the oldest segments are deleted as new ones are started.
+
+Segments are read back as NumPy structured arrays over the mapped file.
+"""
+import bisect
+import collections
+import mmap
+import os
+import re
+import struct
+import time
+
+from canbus.filters import CAN_MTU
+
+MAGIC = b"CANREC1\0"
+HEADER_SIZE = 64
+HEADER_STRUCT = struct.Struct("<8sIIQ")
+RECORD_STRUCT = struct.Struct("=d16s")
+RECORD_SIZE = RECORD_STRUCT.size
+TIMESTAMP_STRUCT = struct.Struct("=d")
+INDEX_STRUCT = struct.Struct("<dQ")
+
+DEFAULT_SEGMENT_RECORDS = 1 << 20
+DEFAULT_FLUSH_INTERVAL = 1.0
+INDEX_INTERVAL = 1024
+SEGMENT_PATTERN = re.compile(r"segment-(\d+)\.canrec$")
+
+RECORD_DTYPE = [
+    ("timestamp", "<f8"),
+    ("can_id", "=u4"),
+    ("length", "u1"),
+    ("padding", "V3"),
+    ("data", "u1", (8,)),
+]
+
+
+def segment_name(number):
+    return f"segment-{number:06d}.canrec"
+
+
+def segment_numbers(directory):
+    matches = (SEGMENT_PATTERN.match(name) for name in os.listdir(directory))
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+class Segment:
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.count = 0
+        self.index = []
+
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+        self._file = open(path, "x+b")
+        self._file.truncate(size)
+        self.map = mmap.mmap(self._file.fileno(), size)
+        HEADER_STRUCT.pack_into(self.map, 0, MAGIC, RECORD_SIZE, capacity, 0)
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def flush(self):
+        HEADER_STRUCT.pack_into(self.map, 0, MAGIC, RECORD_SIZE, self.capacity, self.count)
+        self.map.flush()
+        with open(self.path + ".idx", "wb") as f:
+            f.write(b"".join(INDEX_STRUCT.pack(*entry) for entry in self.index))
+
+    def close(self):
+        self.flush()
+        self.map.close()
+        self._file.close()
+
+
+class FrameRecorder:
+    """
+    Raw subscriber for CANHandler.add_raw_subscriber. write() receives the
+    wake-up's timestamp and a buffer of contiguous struct can_frames.
+
+    max_segments, if given, bounds the segments kept in the directory,
+    including those left by earlier recorders.
+    """
+    def __init__(self, directory, segment_records=DEFAULT_SEGMENT_RECORDS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_segments=None):
+        if max_segments is not None and max_segments < 1:
+            raise ValueError("max_segments must be at least 1")
+        self.directory = directory
+        self.segment_records = segment_records
+        self.flush_interval = flush_interval
+        self.max_segments = max_segments
+        self.records = 0
+        self.segments = 0
+        self._segment = None
+        self._last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self._kept = collections.deque(segment_numbers(directory))
+        self._next_number = self._kept[-1] + 1 if self._kept else 0
+
+    def _rotate(self):
+        if self._segment is not None:
+            self._segment.close()
+        path = os.path.join(self.directory, segment_name(self._next_number))
+        self._segment = Segment(path, self.segment_records)
+        self._kept.append(self._next_number)
+        self._next_number += 1
+        self.segments += 1
+        if self.max_segments is not None:
+            while len(self._kept) > self.max_segments:
+                self._remove(self._kept.popleft())
+
+    def _remove(self, number):
+        path = os.path.join(self.directory, segment_name(number))
+        for name in (path, path + ".idx"):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+    def write(self, timestamp, frames):
+        # frames may be bytes or a memoryview over the handler's receive
+        # buffer, so the frame is copied in by slice assignment.
+        pack_into = TIMESTAMP_STRUCT.pack_into
+        segment = self._segment
+        for offset in range(0, len(frames), CAN_MTU):
+            if segment is None or segment.full:
+                self._rotate()
+                segment = self._segment
+            count = segment.count
+            if count % INDEX_INTERVAL == 0:
+                segment.index.append((timestamp, count))
+            position = HEADER_SIZE + count * RECORD_SIZE
+            pack_into(segment.map, position, timestamp)
+            position += TIMESTAMP_STRUCT.size
+            segment.map[position:position + CAN_MTU] = frames[offset:offset + CAN_MTU]
+            segment.count = count + 1
+        self.records += len(frames) // CAN_MTU
+
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+            self._last_flush = now
+
+    def flush(self):
+        if self._segment is not None:
+            self._segment.flush()
+
+    def close(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+
+def read_segment(path):
+    """
+    Map a segment read-only and return (records, mmap). records is a NumPy
+    structured array viewing the mapped file without copying; the mmap must
+    stay open while it is used.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Reading recorded segments requires numpy") from None
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, record_size, capacity, count = HEADER_STRUCT.unpack_from(mapped, 0)
+    if magic != MAGIC or record_size != RECORD_SIZE:
+        mapped.close()
+        raise ValueError(f"{path} is not a CAN recording segment")
+
+    records = numpy.frombuffer(mapped, dtype=numpy.dtype(RECORD_DTYPE), count=count, offset=HEADER_SIZE)
+    return records, mapped
+
+
+def iter_records(path):
+    """
+    Yield (timestamp, frame) pairs from a segment without NumPy, where frame
+    is the raw 16 byte struct can_frame.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, record_size, capacity, count = HEADER_STRUCT.unpack_from(mapped, 0)
+            if magic != MAGIC or record_size != RECORD_SIZE:
+                raise ValueError(f"{path} is not a CAN recording segment")
+            records = mapped[HEADER_SIZE:HEADER_SIZE + count * RECORD_SIZE]
+    yield from RECORD_STRUCT.iter_unpack(records)
+
+
+def segment_paths(directory):
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.endswith(".canrec")
+    ]
+
+
+def iter_segments(directory):
+    for path in segment_paths(directory):
+        yield read_segment(path)
+
+
+def read_index(path):
+    with open(path + ".idx", "rb") as f:
+        return list(INDEX_STRUCT.iter_unpack(f.read()))
+
+
+def seek(path, timestamp):
+    """
+    Return the record number at which to start reading for timestamp. The
+    index is sparse, so records before that point may still need skipping.
+    """
+    index = read_index(path)
+    position = bisect.bisect_right([entry[0] for entry in index], timestamp) - 1
+    return index[position][1] if position >= 0 else 0
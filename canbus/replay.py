@@ -0,0 +1,166 @@
+"""
+Replays recorded CAN traffic onto a bus or straight into a CANHandler.
+
+Logs are read with python-can's LogReader (.asc, .blf, candump .log, .csv,
+.trc) or from FrameRecorder segments (.canrec files or a directory of them).
+Frames are paced against their recorded timestamps: speed 1 is real time,
+speed N is N times faster and speed 0 is as fast as possible. Each frame's
+due time is computed from the start of the replay, so sleep overshoot is
+corrected on the next frame instead of accumulating.
+
+    python -m canbus.replay drive.asc --interface vcan0 --speed 2
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import can
+
+from canbus.filters import CAN_EFF_FLAG
+from canbus.handler import FRAME_DATA_STRUCT, MAX_BATCH
+from canbus.recorder import iter_records, segment_paths
+from canbus.sender import write_frame
+
+
+def message_frame(message):
+    can_id = message.arbitration_id
+    if message.is_extended_id:
+        can_id |= CAN_EFF_FLAG
+    return FRAME_DATA_STRUCT.pack(can_id, message.dlc, bytes(message.data))
+
+
+def read_log(path):
+    """
+    Yield (timestamp, frame) pairs, frame being a raw struct can_frame.
+    """
+    if os.path.isdir(path):
+        for segment in segment_paths(path):
+            yield from iter_records(segment)
+    elif path.endswith(".canrec"):
+        yield from iter_records(path)
+    else:
+        for message in can.LogReader(path):
+            if not message.is_error_frame and not message.is_remote_frame:
+                yield message.timestamp, message_frame(message)
+
+
+class HandlerTarget:
+    """
+    Feeds frames into a handler's decode and dispatch path, honouring the
+    'block' queue policy.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+
+    def start(self):
+        self.handler.start_subscribers()
+
+    async def send(self, timestamp, frames):
+        for queue in self.handler.feed(frames, timestamp):
+            await queue.wait_for_space()
+
+
+class BusTarget:
+    """
+    Writes frames onto a bus, e.g. a vcan interface another process reads.
+    """
+    def __init__(self, bus):
+        self.bus = bus
+        self._socket = getattr(bus, 'socket', None)
+
+    def start(self):
+        pass
+
+    async def send(self, timestamp, frames):
+        if self._socket is not None:
+            for offset in range(0, len(frames), FRAME_DATA_STRUCT.size):
+                write_frame(self._socket, frames[offset:offset + FRAME_DATA_STRUCT.size])
+            return
+
+        for can_id, length, data in FRAME_DATA_STRUCT.iter_unpack(frames):
+            self.bus.send(can.Message(
+                arbitration_id=can_id & ~CAN_EFF_FLAG,
+                is_extended_id=bool(can_id & CAN_EFF_FLAG),
+                data=data[:length]))
+
+
+class Replayer:
+    def __init__(self, records, speed=1.0):
+        self.records = records
+        self.speed = speed
+        self.frames = 0
+        self.batches = 0
+        self.max_lag = 0.0
+        self.duration = 0.0
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "batches": self.batches,
+            "max_lag": self.max_lag,
+            "duration": self.duration,
+        }
+
+    async def run(self, target):
+        target.start()
+        start = time.monotonic()
+        first = None
+        batch = []
+        batch_timestamp = None
+
+        for timestamp, frame in self.records:
+            if first is None:
+                first = timestamp
+
+            if self.speed:
+                due = start + (timestamp - first) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    # Everything already due goes out before sleeping.
+                    if batch:
+                        await self._send(target, batch_timestamp, batch)
+                        batch = []
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+
+            if not batch:
+                batch_timestamp = timestamp
+            batch.append(frame)
+            if len(batch) >= MAX_BATCH:
+                await self._send(target, batch_timestamp, batch)
+                batch = []
+                if not self.speed:
+                    # Let subscribers run between batches.
+                    await asyncio.sleep(0)
+
+        if batch:
+            await self._send(target, batch_timestamp, batch)
+        self.duration = time.monotonic() - start
+
+    async def _send(self, target, timestamp, batch):
+        await target.send(timestamp, b"".join(batch))
+        self.frames += len(batch)
+        self.batches += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a CAN log onto a socketcan interface")
+    parser.add_argument('log')
+    parser.add_argument('--interface', default='vcan0')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Playback speed multiplier, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    bus = can.interface.Bus(args.interface, bustype='socketcan')
+    replayer = Replayer(read_log(args.log), args.speed)
+    try:
+        asyncio.run(replayer.run(BusTarget(bus)))
+    finally:
+        bus.shutdown()
+    print(replayer.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Split-process deployment: CAN ingest in one process, BLE/D-Bus in another,
+connected by a single-producer ring buffer in shared memory.
+
+The ingest process runs a normal CANHandler with a RingPublisher
+subscriber that writes decoded (can_id, module_id, key, value) frames into
+the ring. The BLE process uses a RingHandler, which polls the ring and
+dispatches frames through the usual routing, cache and subscriber queues,
+so services written against CANHandler work unchanged.
+
+The producer never waits for the consumer. Each slot carries its sequence
+number, written last and cleared before the payload is rewritten, so a
+reader that falls more than a ring behind, or reads a slot while it is
+being overwritten, detects the overrun and counts the frames it lost.
+"""
+import asyncio
+import logging
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+
+from canbus.dispatch import FrameDispatcher
+from canbus.handler import CANHandler, MAX_BATCH
+from canbus.log import configure as configure_logging
+from canbus.signals import SignalDatabase
+from canbus.tracing import Histogram
+
+DEFAULT_CAPACITY = 4096
+DEFAULT_POLL_INTERVAL = 0.002
+
+# Header: write sequence, capacity, record size. Sequences start at 1 so a
+# zero slot sequence means "being written".
+HEADER_STRUCT = struct.Struct("<QII")
+HEADER_SIZE = 64
+# Record: sequence, monotonic ns at publish, can_id, module_id, key,
+# value kind, value. The value field holds an int64, uint64 or double as
+# the kind says, so 64 bit integer signals survive the trip exactly.
+RECORD_STRUCT = struct.Struct("<QQIBBBxq")
+RECORD_SIZE = RECORD_STRUCT.size
+VALUE_OFFSET = RECORD_SIZE - 8
+VALUE_STRUCTS = (struct.Struct("<q"), struct.Struct("<Q"), struct.Struct("<d"))
+INT_VALUE, UINT_VALUE, FLOAT_VALUE = range(3)
+SEQUENCE_STRUCT = struct.Struct("<Q")
+# A slot that keeps failing its sequence check, e.g. because the writer
+# died mid-record, is retried this often per read before giving up.
+MAX_READ_RETRIES = 3
+
+log = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    def __init__(self, name=None, capacity=DEFAULT_CAPACITY, create=False):
+        if create:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=HEADER_SIZE + capacity * RECORD_SIZE)
+            HEADER_STRUCT.pack_into(self.shm.buf, 0, 0, capacity, RECORD_SIZE)
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+        _, self.capacity, record_size = HEADER_STRUCT.unpack_from(self.shm.buf, 0)
+        if record_size != RECORD_SIZE:
+            raise ValueError(f"Ring {self.shm.name} has {record_size} byte records, expected {RECORD_SIZE}")
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+
+    def write_sequence(self):
+        return SEQUENCE_STRUCT.unpack_from(self.buf, 0)[0]
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class RingWriter:
+    def __init__(self, ring):
+        self.ring = ring
+        self.sequence = ring.write_sequence()
+
+    def write(self, frames):
+        buf = self.ring.buf
+        capacity = self.ring.capacity
+        pack_into = RECORD_STRUCT.pack_into
+        clear = SEQUENCE_STRUCT.pack_into
+        now = time.monotonic_ns()
+        sequence = self.sequence
+        for can_id, module_id, key, value in frames:
+            sequence += 1
+            offset = HEADER_SIZE + (sequence % capacity) * RECORD_SIZE
+            clear(buf, offset, 0)
+            # The payload goes in with a zero sequence, then the sequence.
+            if isinstance(value, float):
+                kind = FLOAT_VALUE
+            elif value > 0x7FFFFFFFFFFFFFFF:
+                kind = UINT_VALUE
+            else:
+                kind = INT_VALUE
+            pack_into(buf, offset, 0, now, can_id, module_id, key, kind, 0)
+            VALUE_STRUCTS[kind].pack_into(buf, offset + VALUE_OFFSET, value)
+            clear(buf, offset, sequence)
+        self.sequence = sequence
+        SEQUENCE_STRUCT.pack_into(buf, 0, sequence)
+
+
+class RingReader:
+    def __init__(self, ring):
+        self.ring = ring
+        self.sequence = ring.write_sequence()
+        self.overruns = 0
+        self.lost = 0
+        self.read = 0
+        # Publish-to-read latency of the newest frame of each read, in ns.
+        self.latency = Histogram()
+
+    def read_batch(self, limit=MAX_BATCH):
+        buf = self.ring.buf
+        capacity = self.ring.capacity
+        unpack_from = RECORD_STRUCT.unpack_from
+        sequence_from = SEQUENCE_STRUCT.unpack_from
+
+        written = SEQUENCE_STRUCT.unpack_from(buf, 0)[0]
+        if written - self.sequence > capacity:
+            self._overrun(written - capacity)
+
+        frames = []
+        published = None
+        retries = 0
+        while self.sequence < written and len(frames) < limit:
+            expected = self.sequence + 1
+            offset = HEADER_SIZE + (expected % capacity) * RECORD_SIZE
+            sequence, published_ns, can_id, module_id, key, kind, value = unpack_from(buf, offset)
+            if kind != INT_VALUE:
+                value = VALUE_STRUCTS[kind].unpack_from(buf, offset + VALUE_OFFSET)[0]
+            if sequence != expected or sequence_from(buf, offset)[0] != expected:
+                # Overwritten before or while we read it. What was read so
+                # far is returned if the slot does not settle.
+                retries += 1
+                if retries > MAX_READ_RETRIES:
+                    break
+                self._overrun(SEQUENCE_STRUCT.unpack_from(buf, 0)[0] - capacity + 1)
+                continue
+            frames.append((can_id, module_id, key, value))
+            published = published_ns
+            self.sequence = expected
+
+        if published is not None:
+            self.latency.record(time.monotonic_ns() - published)
+        self.read += len(frames)
+        return frames
+
+    def _overrun(self, sequence):
+        if sequence > self.sequence:
+            self.overruns += 1
+            self.lost += sequence - self.sequence
+            log.warning("Ring overrun, lost %d frames", sequence - self.sequence)
+            self.sequence = sequence
+
+    def stats(self):
+        return {
+            "read": self.read,
+            "overruns": self.overruns,
+            "lost": self.lost,
+            "pending": self.ring.write_sequence() - self.sequence,
+            "latency": self.latency.summary(),
+        }
+
+
+class RingPublisher:
+    """
+    CANHandler subscriber copying every decoded frame into the ring.
+    """
+    def __init__(self, ring):
+        self.writer = RingWriter(ring)
+
+    def notify_batch(self, frames):
+        self.writer.write(frames)
+
+
+class RingHandler(FrameDispatcher):
+    """
+    Subscriber side of a split deployment: the CANHandler subscription API
+    fed from a ring instead of a bus. Sending and bus control stay with the
+    ingest process.
+    """
+    def __init__(self, ring_name, poll_interval=DEFAULT_POLL_INTERVAL, signals=None, cache=None,
+                 change_filter=None):
+        FrameDispatcher.__init__(self, signals, cache, change_filter)
+        self.ring = RingBuffer(ring_name)
+        self.reader = RingReader(self.ring)
+        self.poll_interval = poll_interval
+        self._stop_flag = False
+
+    async def receive_can_message(self):
+        log.info("Reading CAN frames from ring %s", self.ring.name)
+        self.start_subscribers()
+        try:
+            while not self._stop_flag:
+                frames = self.reader.read_batch()
+                if not frames:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                for queue in self._dispatch_batch(frames):
+                    await queue.wait_for_space()
+                await asyncio.sleep(0)
+        finally:
+            self.stop_subscribers()
+        log.info("Ring reading loop stopped")
+
+    def stop(self):
+        self._stop_flag = True
+
+
+def run_ingest(ring_name, interface='can0', bitrate=100000, database_path=None, **handler_options):
+    # Runs in a spawned interpreter, so logging is set up afresh. The signal
+    # database is loaded here rather than passed in, as compiled decoders do
+    # not pickle.
+    configure_logging()
+    if database_path is not None:
+        handler_options["signals"] = SignalDatabase.load(database_path)
+    handler = CANHandler(interface, bitrate, **handler_options)
+    ring = RingBuffer(ring_name)
+    handler.add_subscriber(RingPublisher(ring), maxsize=MAX_BATCH * 4)
+    try:
+        asyncio.run(handler.receive_can_message())
+    finally:
+        ring.close()
+
+
+def start_ingest(ring_name, interface='can0', bitrate=100000, database_path=None, **handler_options):
+    # Spawned rather than forked: a fork would inherit the parent's logging
+    # queue listener thread (not running in the child) and D-Bus/GLib state.
+    process = multiprocessing.get_context('spawn').Process(
+        target=run_ingest, args=(ring_name, interface, bitrate, database_path), kwargs=handler_options,
+        name=f"canbus-ingest-{interface}", daemon=True)
+    process.start()
+    return process
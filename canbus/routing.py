@@ -0,0 +1,71 @@
+import itertools
+
+# Resolved frame keys kept before the cache is reset.
+MAX_CACHED_KEYS = 4096
+
+
+class RoutingTable:
+    """
+    Routes decoded frames to subscriber queues by (can_id, module_id, key).
+    Subscriptions are patterns in which None matches anything; lookups for
+    a concrete frame key are resolved once and cached until a subscription
+    that matches that key changes.
+    """
+    def __init__(self):
+        self._patterns = {}
+        self._subscriptions = {}
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def add(self, queue, can_id=None, module_id=None, key=None):
+        subscriber = queue.subscriber
+        if subscriber in self._subscriptions:
+            self.remove(subscriber)
+
+        pattern = (can_id, module_id, key)
+        self._patterns.setdefault(pattern, {})[subscriber] = queue
+        self._subscriptions[subscriber] = pattern
+        self._invalidate(pattern)
+
+    def remove(self, subscriber):
+        pattern = self._subscriptions.pop(subscriber)
+        queues = self._patterns[pattern]
+        del queues[subscriber]
+        if not queues:
+            del self._patterns[pattern]
+        self._invalidate(pattern)
+
+    def pattern(self, subscriber):
+        return self._subscriptions.get(subscriber)
+
+    def patterns(self):
+        return self._patterns.keys()
+
+    def _invalidate(self, pattern):
+        # Only cached keys the changed pattern matches can have a different
+        # set of queues now.
+        stale = [
+            frame_key for frame_key in self._cache
+            if all(part is None or part == value for part, value in zip(pattern, frame_key))
+        ]
+        for frame_key in stale:
+            del self._cache[frame_key]
+
+    def _resolve(self, frame_key):
+        can_id, module_id, key = frame_key
+        queues = []
+        for pattern in itertools.product((can_id, None), (module_id, None), (key, None)):
+            matched = self._patterns.get(pattern)
+            if matched:
+                queues.extend(matched.values())
+        return tuple(queues)
+
+    def lookup(self, frame_key):
+        queues = self._cache.get(frame_key)
+        if queues is None:
+            if len(self._cache) >= MAX_CACHED_KEYS:
+                self._cache.clear()
+            queues = self._cache[frame_key] = self._resolve(frame_key)
+        return queues
@@ -0,0 +1,128 @@
+import can
+import logging
+import struct
+import threading
+import time
+
+from canbus.tracing import Histogram
+
+# Priority classes, highest first.
+SAFETY = 0
+CONTROL = 1
+BULK = 2
+PRIORITIES = (SAFETY, CONTROL, BULK)
+
+log = logging.getLogger(__name__)
+
+
+class SendScheduler:
+    """
+    Queues outgoing (can_id, module_id, key, value) writes for a dedicated
+    sender thread, so callers such as D-Bus method handlers never wait on
+    the bus. Writes go out highest priority class first; a write to a key
+    that is still queued replaces the pending value instead of queueing a
+    second frame. The sender must not be used from other threads, as its
+    frame buffers are filled in place.
+    """
+    def __init__(self, sender):
+        self.sender = sender
+        self.queued = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.errors = 0
+        # Enqueue-to-sent latency in ns, i.e. until the frame is handed to
+        # the kernel.
+        self.latency = Histogram()
+        # Per priority class: frame key -> (value, enqueue time), in order
+        # of the key's first pending write.
+        self._pending = {priority: {} for priority in PRIORITIES}
+        self._priorities = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stop_flag = False
+
+    def __len__(self):
+        return len(self._priorities)
+
+    def stats(self):
+        return {
+            "pending": len(self._priorities),
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "sent": self.sent,
+            "errors": self.errors,
+            "latency": self.latency.summary(),
+        }
+
+    def put(self, can_id, module_id, key, value, priority=CONTROL):
+        if priority not in self._pending:
+            raise ValueError(f"Unknown send priority: {priority}")
+
+        frame_key = (can_id, module_id, key)
+        with self._condition:
+            previous = self._priorities.get(frame_key)
+            enqueued = time.monotonic_ns()
+            if previous is not None:
+                # Superseded: the newer value goes out at the more urgent
+                # of the two priorities. Latency still counts from the
+                # first pending write.
+                self.coalesced += 1
+                enqueued = self._pending[previous][frame_key][1]
+                if previous <= priority:
+                    self._pending[previous][frame_key] = (value, enqueued)
+                    return
+                del self._pending[previous][frame_key]
+            else:
+                self.queued += 1
+            self._pending[priority][frame_key] = (value, enqueued)
+            self._priorities[frame_key] = priority
+            self._condition.notify()
+
+        if self._thread is None:
+            self.start()
+
+    def _take(self):
+        # Called with the condition held and at least one write pending.
+        for priority in PRIORITIES:
+            pending = self._pending[priority]
+            if pending:
+                frame_key = next(iter(pending))
+                value, enqueued = pending.pop(frame_key)
+                del self._priorities[frame_key]
+                return frame_key, value, enqueued
+
+    def _run(self):
+        send = self.sender.send
+        while True:
+            with self._condition:
+                while not self._priorities and not self._stop_flag:
+                    self._condition.wait()
+                if self._stop_flag:
+                    return
+                (can_id, module_id, key), value, enqueued = self._take()
+
+            try:
+                send(can_id, module_id, key, value)
+            except (OSError, struct.error, can.CanError) as e:
+                self.errors += 1
+                log.error("Failed to send key %s to module %s on %#x: %s", key, module_id, can_id, e)
+                continue
+            self.latency.record(time.monotonic_ns() - enqueued)
+            self.sent += 1
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stop_flag = False
+            self._thread = threading.Thread(target=self._run, name="can-send", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Pending writes are discarded.
+        with self._condition:
+            self._stop_flag = True
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
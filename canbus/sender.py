@@ -0,0 +1,93 @@
+import can
+import errno
+import select
+import struct
+
+from canbus.filters import CAN_MTU, CAN_SFF_MASK, CAN_EFF_FLAG, PAYLOAD_LENGTH
+
+SEND_RETRY_TIMEOUT = 0.1
+
+FRAME_HEADER_STRUCT = struct.Struct("=IB3x")
+FRAME_MODULE_OFFSET = 8
+# Key and value are packed in place after the module byte.
+FRAME_VALUE_STRUCT = struct.Struct(">BI")
+FRAME_VALUE_OFFSET = FRAME_MODULE_OFFSET + 1
+
+
+def write_frame(sock, frame):
+    """
+    Write one raw struct can_frame to a CAN socket.
+    """
+    try:
+        sock.send(frame)
+    except OSError as e:
+        # The interface queue is full; wait for room once before failing.
+        if e.errno != errno.ENOBUFS:
+            raise
+        select.select([], [sock], [], SEND_RETRY_TIMEOUT)
+        sock.send(frame)
+
+
+class FrameSender:
+    """
+    Sends module/key/value frames from buffers preallocated per
+    (can_id, module_id), so a send only packs key and value in place.
+    """
+    def __init__(self, bus):
+        self.bus = bus
+        self._socket = getattr(bus, 'socket', None)
+        self._frames = {}
+
+    def _frame(self, can_id, module_id):
+        frame = self._frames.get((can_id, module_id))
+        if frame is not None:
+            return frame
+
+        if self._socket is not None:
+            # A raw struct can_frame written straight to the socket.
+            frame = bytearray(CAN_MTU)
+            raw_id = can_id | CAN_EFF_FLAG if can_id > CAN_SFF_MASK else can_id
+            FRAME_HEADER_STRUCT.pack_into(frame, 0, raw_id, PAYLOAD_LENGTH)
+            frame[FRAME_MODULE_OFFSET] = module_id
+        else:
+            # can.Message keeps a bytearray payload by reference, so the
+            # message itself is reused and only its data is rewritten.
+            data = bytearray(PAYLOAD_LENGTH)
+            data[0] = module_id
+            frame = can.Message(arbitration_id=can_id, data=data, is_extended_id=can_id > CAN_SFF_MASK)
+
+        self._frames[(can_id, module_id)] = frame
+        return frame
+
+    def _write(self, frame):
+        write_frame(self._socket, frame)
+
+    def send(self, can_id, module_id, key, value):
+        frame = self._frame(can_id, module_id)
+        if self._socket is not None:
+            FRAME_VALUE_STRUCT.pack_into(frame, FRAME_VALUE_OFFSET, key, value)
+            self._write(frame)
+        else:
+            FRAME_VALUE_STRUCT.pack_into(frame.data, 1, key, value)
+            self.bus.send(frame)
+
+    def send_many(self, can_id, module_id, items):
+        # Raw CAN sockets take exactly one frame per write, so a burst is a
+        # tight loop over the same preallocated frame.
+        frame = self._frame(can_id, module_id)
+        pack_into = FRAME_VALUE_STRUCT.pack_into
+        sent = 0
+        if self._socket is not None:
+            write = self._write
+            for key, value in items:
+                pack_into(frame, FRAME_VALUE_OFFSET, key, value)
+                write(frame)
+                sent += 1
+        else:
+            data = frame.data
+            send = self.bus.send
+            for key, value in items:
+                pack_into(data, 1, key, value)
+                send(frame)
+                sent += 1
+        return sent
@@ -0,0 +1,203 @@
+"""
+Signal database describing how CAN payloads map to named values.
+
+The database is a JSON document:
+
+    {
+        "messages": [
+            {
+                "can_id": "0x123",
+                "name": "engine",
+                "length": 8,
+                "signals": [
+                    {"name": "rpm", "start": 0, "length": 16,
+                     "byte_order": "big", "signed": false,
+                     "scale": 0.25, "offset": 0, "unit": "rpm",
+                     "module": 18, "key": 1}
+                ]
+            }
+        ]
+    }
+
+Bits are numbered from the start of the payload: for little-endian signals
+start is the least significant bit counting from bit 0 of byte 0, for
+big-endian signals it is the most significant bit counting from the top bit
+of byte 0. module and key place a signal in the handler's
+(can_id, module_id, key) routing and default to 0 and the signal's index.
+
+Each message is compiled once into a decoder function that turns a payload
+into the list of (can_id, module_id, key, value) frames the handler routes.
+Byte-aligned messages whose signals share a byte order use one struct
+unpack; anything else unpacks the payload into a single integer and
+extracts signals with shifts and masks.
+"""
+import json
+import struct
+
+BYTE_ORDERS = ('little', 'big')
+STRUCT_FORMATS = {
+    (8, False): 'B', (8, True): 'b',
+    (16, False): 'H', (16, True): 'h',
+    (32, False): 'I', (32, True): 'i',
+    (64, False): 'Q', (64, True): 'q',
+}
+
+
+def _int(value):
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+class Signal:
+    def __init__(self, name, start, length, byte_order='little', signed=False,
+                 scale=1, offset=0, unit=None, module=0, key=0, uuid=None):
+        if byte_order not in BYTE_ORDERS:
+            raise ValueError(f"Signal {name}: unknown byte order {byte_order}")
+        if length < 1 or length > 64:
+            raise ValueError(f"Signal {name}: length must be between 1 and 64 bits")
+
+        self.name = name
+        self.start = start
+        self.length = length
+        self.byte_order = byte_order
+        self.signed = signed
+        self.scale = scale
+        self.offset = offset
+        self.unit = unit
+        self.module = module
+        self.key = key
+        self.uuid = uuid
+
+    @property
+    def is_float(self):
+        return isinstance(self.scale, float) or isinstance(self.offset, float)
+
+    def physical_range(self):
+        # (minimum, maximum) decoded value, i.e. the raw range with scale
+        # and offset applied.
+        if self.signed:
+            raw = (-(1 << (self.length - 1)), (1 << (self.length - 1)) - 1)
+        else:
+            raw = (0, (1 << self.length) - 1)
+        ends = [value * self.scale + self.offset for value in raw]
+        return min(ends), max(ends)
+
+    def scaled(self, expression):
+        if self.scale != 1:
+            expression = f"{expression} * {self.scale!r}"
+        if self.offset != 0:
+            expression = f"{expression} + {self.offset!r}"
+        return expression
+
+
+class Message:
+    def __init__(self, can_id, name, length, signals):
+        self.can_id = can_id
+        self.name = name
+        self.length = length
+        self.signals = signals
+
+        for signal in signals:
+            if signal.start + signal.length > length * 8:
+                raise ValueError(f"Signal {signal.name} does not fit in {name}")
+
+        self.decode = self._compile()
+
+    def _struct_format(self):
+        # A single struct covers the message when every signal is a whole
+        # standard-width field in the same byte order.
+        byte_orders = {signal.byte_order for signal in self.signals}
+        if len(byte_orders) != 1:
+            return None
+
+        fields = []
+        position = 0
+        for signal in sorted(self.signals, key=lambda signal: signal.start):
+            fmt = STRUCT_FORMATS.get((signal.length, signal.signed))
+            if fmt is None or signal.start % 8 or signal.start < position:
+                return None
+            if signal.start > position:
+                fields.append(f"{(signal.start - position) // 8}x")
+            fields.append(fmt)
+            position = signal.start + signal.length
+
+        prefix = '<' if byte_orders.pop() == 'little' else '>'
+        return prefix + ''.join(fields)
+
+    def _compile(self):
+        fmt = self._struct_format()
+        namespace = {}
+
+        if fmt is not None:
+            # Struct fields come out in start order.
+            ordered = sorted(self.signals, key=lambda signal: signal.start)
+            names = [f"v{index}" for index in range(len(ordered))]
+            namespace["unpack_from"] = struct.Struct(fmt).unpack_from
+            lines = [f"    {', '.join(names)}, = unpack_from(data)"]
+            values = {id(signal): signal.scaled(name) for signal, name in zip(ordered, names)}
+        else:
+            bits = self.length * 8
+            lines = []
+            values = {}
+            for byte_order in BYTE_ORDERS:
+                if any(signal.byte_order == byte_order for signal in self.signals):
+                    lines.append(f"    {byte_order} = int.from_bytes(data[:{self.length}], '{byte_order}')")
+            for signal in self.signals:
+                mask = (1 << signal.length) - 1
+                if signal.byte_order == 'little':
+                    shift = signal.start
+                else:
+                    shift = bits - signal.start - signal.length
+                raw = f"(({signal.byte_order} >> {shift}) & {mask:#x})"
+                if signal.signed:
+                    sign = 1 << (signal.length - 1)
+                    raw = f"(({raw} ^ {sign:#x}) - {sign:#x})"
+                values[id(signal)] = signal.scaled(raw)
+
+        frames = ", ".join(
+            f"({self.can_id:#x}, {signal.module}, {signal.key}, {values[id(signal)]})"
+            for signal in self.signals
+        )
+        source = "def decode(data):\n" + "\n".join(lines) + f"\n    return [{frames}]\n"
+        exec(compile(source, f"<decoder {self.name}>", "exec"), namespace)
+        return namespace["decode"]
+
+
+class SignalDatabase:
+    def __init__(self, messages):
+        self.messages = {message.can_id: message for message in messages}
+        # Arbitration ID -> (payload length, compiled decoder), built once.
+        self.decoders = {
+            message.can_id: (message.length, message.decode) for message in messages
+        }
+
+    @classmethod
+    def from_dict(cls, document):
+        messages = []
+        for entry in document["messages"]:
+            signals = []
+            for index, signal in enumerate(entry["signals"]):
+                signal = dict(signal)
+                signal.setdefault("key", index)
+                signals.append(Signal(**signal))
+            messages.append(Message(_int(entry["can_id"]), entry.get("name", hex(_int(entry["can_id"]))),
+                                    entry.get("length", 8), signals))
+        return cls(messages)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def can_ids(self):
+        return list(self.messages)
+
+    def signals(self):
+        for message in self.messages.values():
+            for signal in message.signals:
+                yield message, signal
+
+    def decode(self, can_id, data):
+        decoder = self.decoders.get(can_id)
+        if decoder is None or len(data) < decoder[0]:
+            return None
+        return decoder[1](data)
@@ -0,0 +1,188 @@
+"""
+Latency tracing from CAN frame arrival to BLE notification emit.
+
+Every latency is measured from the moment the handler starts reading a
+wake-up's frames, so each stage's histogram shows how long frames take to
+get that far through the pipeline:
+
+    receive   frames read from the socket
+    decode    frames decoded
+    dispatch  frame put on its subscribers' queues
+    enqueue   value handed to the notification scheduler
+    emit      PropertiesChanged sent
+
+Stages are recorded in preallocated log-linear histograms, globally and per
+(can_id, module_id, key) where the key is known. Tracing is off by default;
+instrumented code checks tracer.enabled before doing anything else.
+
+Percentiles can be dumped on a signal (install_signal_handler) or read from
+a local UNIX socket (serve).
+"""
+import asyncio
+import json
+import signal
+import sys
+import time
+from array import array
+
+RECEIVE = 'receive'
+DECODE = 'decode'
+DISPATCH = 'dispatch'
+ENQUEUE = 'enqueue'
+EMIT = 'emit'
+STAGES = (RECEIVE, DECODE, DISPATCH, ENQUEUE, EMIT)
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Values below 2**PRECISION_BITS get a bucket each; above that every power
+# of two is split into 2**(PRECISION_BITS - 1) buckets (~6% resolution).
+PRECISION_BITS = 5
+MAX_VALUE_BITS = 40
+LINEAR_BUCKETS = 1 << PRECISION_BITS
+SUB_BUCKETS = 1 << (PRECISION_BITS - 1)
+BUCKETS = LINEAR_BUCKETS + (MAX_VALUE_BITS - PRECISION_BITS) * SUB_BUCKETS
+MAX_VALUE = (1 << MAX_VALUE_BITS) - 1
+
+
+def bucket_index(value):
+    if value < LINEAR_BUCKETS:
+        return value
+    if value > MAX_VALUE:
+        value = MAX_VALUE
+    shift = value.bit_length() - PRECISION_BITS
+    return LINEAR_BUCKETS + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_value(index):
+    # Midpoint of the range of values that land in the bucket.
+    if index < LINEAR_BUCKETS:
+        return index
+    shift, mantissa = divmod(index - LINEAR_BUCKETS, SUB_BUCKETS)
+    shift += 1
+    return ((mantissa + SUB_BUCKETS) << shift) + (1 << (shift - 1))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * BUCKETS))
+        self.count = 0
+        self.max = 0
+
+    def record(self, value):
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        target = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bucket_value(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        self.counts = array('Q', bytes(8 * BUCKETS))
+        self.count = 0
+        self.max = 0
+
+    def summary(self):
+        # Nanoseconds converted to microseconds for reading.
+        summary = {"count": self.count, "max_us": self.max / 1000}
+        for percent in PERCENTILES:
+            summary[f"p{percent}_us"] = self.percentile(percent) / 1000
+        return summary
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.keys = {}
+        # (can_id, module_id, key) -> start of the wake-up that last carried it.
+        self.received = {}
+        # Frame key being delivered by a subscriber queue, so a synchronous
+        # notify can attribute what it enqueues.
+        self.current = None
+
+    now = staticmethod(time.perf_counter_ns)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        for histogram in self.stages.values():
+            histogram.reset()
+        self.keys.clear()
+        self.received.clear()
+
+    def record(self, stage, start, key=None):
+        latency = time.perf_counter_ns() - start
+        self.stages[stage].record(latency)
+        if key is not None:
+            histogram = self.keys.get((stage, key))
+            if histogram is None:
+                histogram = self.keys[(stage, key)] = Histogram()
+            histogram.record(latency)
+
+    def mark_received(self, frames, start):
+        received = self.received
+        for frame in frames:
+            received[frame[:3]] = start
+
+    def record_frames(self, stage, frames, start):
+        for frame in frames:
+            self.record(stage, start, frame[:3])
+
+    def record_key(self, stage, key):
+        start = self.received.get(key)
+        if start is not None:
+            self.record(stage, start, key)
+
+    def snapshot(self):
+        return {
+            "stages": {stage: histogram.summary() for stage, histogram in self.stages.items()},
+            "keys": {
+                f"{stage}:{can_id:#x}/{module_id}/{key}": histogram.summary()
+                for (stage, (can_id, module_id, key)), histogram in self.keys.items()
+            },
+        }
+
+    def dump(self, stream=sys.stdout):
+        json.dump(self.snapshot(), stream, indent=2)
+        stream.write("\n")
+        stream.flush()
+
+    def install_signal_handler(self, signum=signal.SIGUSR1):
+        # Runs the dump on the event loop, not inside the signal handler.
+        asyncio.get_running_loop().add_signal_handler(signum, self.dump)
+
+    async def serve(self, path):
+        """
+        Answer every connection on a UNIX socket with the current snapshot
+        as JSON, e.g. `socat - UNIX-CONNECT:path`.
+        """
+        async def handle(reader, writer):
+            writer.write(json.dumps(self.snapshot()).encode() + b"\n")
+            await writer.drain()
+            writer.close()
+
+        return await asyncio.start_unix_server(handle, path)
+
+
+tracer = Tracer()
@@ -3,10 +3,13 @@
 VENV_NAME="venv"
 VENV_PATH="./$VENV_NAME"
 
-# Set up the CAN interface
-sudo ip link set can0 down
-sudo ip link set can0 type can bitrate 100000
-sudo ip link set can0 up
+# Set up the CAN interfaces, e.g. CAN_INTERFACES="can0 can1" for PT-CAN and K-CAN
+CAN_INTERFACES="${CAN_INTERFACES:-can0}"
+for CAN_INTERFACE in $CAN_INTERFACES; do
+    sudo ip link set "$CAN_INTERFACE" down
+    sudo ip link set "$CAN_INTERFACE" type can bitrate 100000
+    sudo ip link set "$CAN_INTERFACE" up
+done
 
 # Navigate to the directory where your Python script is located
 cd /home/bmw130/pi-canbus-transceiver
@@ -0,0 +1,13 @@
+from canbus.filters import CAN_EFF_MASK, CAN_SFF_MASK, compile_id_filters
+
+
+def test_extended_ids_default_to_exact_match():
+    assert compile_id_filters([0x123, 0x18FEF100]) == [
+        {"can_id": 0x123, "can_mask": CAN_SFF_MASK, "extended": False},
+        {"can_id": 0x18FEF100, "can_mask": CAN_EFF_MASK, "extended": True},
+    ]
+
+
+def test_explicit_mask_is_kept():
+    assert compile_id_filters(0x18FEF100, 0x1FFFFF00)[0]["can_mask"] == 0x1FFFFF00
+    assert compile_id_filters([(0x100, 0x700)])[0]["can_mask"] == 0x700
@@ -0,0 +1,35 @@
+import asyncio
+
+import can
+
+from canbus.handler import CANHandler
+
+CHANNEL = "test-handler"
+
+
+async def read_after_idle(demand_driven):
+    handler = CANHandler(CHANNEL, bustype="virtual", demand_driven=demand_driven)
+    sender = can.interface.Bus(CHANNEL, interface="virtual")
+    receiver = asyncio.create_task(handler.receive_can_message())
+    try:
+        # Nobody subscribes; a GATT read would only look at the cache.
+        await asyncio.sleep(0.05)
+        sender.send(can.Message(arbitration_id=0x123, data=[0x12, 0x01, 0, 0, 0, 42], is_extended_id=False))
+        for _ in range(50):
+            if handler.cache.get((0x123, 0x12, 0x01)) is not None:
+                break
+            await asyncio.sleep(0.02)
+        return handler.cache.get((0x123, 0x12, 0x01))
+    finally:
+        handler.stop()
+        await receiver
+        handler.bus.shutdown()
+        sender.shutdown()
+
+
+def test_cache_stays_fresh_without_subscribers():
+    assert asyncio.run(read_after_idle(demand_driven=False)) == 42
+
+
+def test_demand_driven_handler_parks_without_subscribers():
+    assert asyncio.run(read_after_idle(demand_driven=True)) is None
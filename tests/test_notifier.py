@@ -0,0 +1,38 @@
+import asyncio
+
+from ble.notifier import NotificationScheduler
+from ble.payload import BatchEncoder
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def send_value(self, value):
+        self.sent.append(value)
+
+
+async def batched_sends():
+    notifier = NotificationScheduler(max_rate=100)
+    characteristic = Recorder()
+    notifier.update_many(characteristic, [(1, 10), (2, 20)])
+    notifier.update_many(characteristic, [(1, 11), (3, 30)])
+    await asyncio.sleep(0.005)
+    # Sent within the interval: merged into the next notification, and
+    # keys whose value did not change are left out.
+    notifier.update_many(characteristic, [(1, 11), (2, 21)])
+    notifier.update_many(characteristic, [(3, 31)])
+    await asyncio.sleep(0.05)
+    return notifier, characteristic.sent
+
+
+def test_update_many_gathers_keys_per_interval():
+    notifier, sent = asyncio.run(batched_sends())
+    assert sent == [{1: 11, 2: 20, 3: 30}, {2: 21, 3: 31}]
+    assert notifier.coalesced == 1
+
+
+def test_batch_encoder_fills_att_payloads():
+    payloads = list(BatchEncoder('I').payloads({key: key * 100 for key in range(5)}))
+    assert [len(payload) for payload in payloads] == [20, 5]
+    assert payloads[1] == bytes([4]) + (400).to_bytes(4, 'little')
@@ -0,0 +1,34 @@
+import os
+import struct
+
+from canbus.recorder import FrameRecorder, iter_records, segment_paths
+
+FRAMES = b"".join(struct.pack("=IB3x8s", 0x100 + index, 8, bytes(8)) for index in range(10))
+
+
+def recorded(directory):
+    return [frame for path in segment_paths(directory) for _, frame in iter_records(path)]
+
+
+def test_restart_keeps_earlier_capture(tmp_path):
+    first = FrameRecorder(str(tmp_path), segment_records=4)
+    first.write(1.0, FRAMES)
+    first.close()
+    second = FrameRecorder(str(tmp_path), segment_records=4)
+    second.write(2.0, FRAMES[:3 * 16])
+    second.close()
+
+    assert len(recorded(str(tmp_path))) == 13
+    assert [os.path.basename(path) for path in segment_paths(str(tmp_path))][-1] == "segment-000003.canrec"
+
+
+def test_max_segments_removes_oldest(tmp_path):
+    recorder = FrameRecorder(str(tmp_path), segment_records=2, max_segments=2)
+    recorder.write(1.0, FRAMES)
+    recorder.close()
+
+    assert sorted(os.listdir(str(tmp_path))) == [
+        "segment-000003.canrec", "segment-000003.canrec.idx",
+        "segment-000004.canrec", "segment-000004.canrec.idx",
+    ]
+    assert recorded(str(tmp_path)) == [FRAMES[offset:offset + 16] for offset in range(96, 160, 16)]
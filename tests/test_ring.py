@@ -0,0 +1,41 @@
+import asyncio
+
+from canbus.ring import RingBuffer, RingHandler, RingWriter
+
+
+class Collector:
+    def __init__(self):
+        self.frames = []
+
+    def notify_batch(self, frames):
+        self.frames.extend(frames)
+
+
+async def dispatch_from_ring():
+    ring = RingBuffer(capacity=64, create=True)
+    try:
+        handler = RingHandler(ring.name, poll_interval=0.001)
+        collector = Collector()
+        handler.add_subscriber(collector, can_id=0x123)
+        receiver = asyncio.create_task(handler.receive_can_message())
+        RingWriter(ring).write([(0x123, 0x12, 1, 42), (0x124, 0x12, 1, 7)])
+        for _ in range(50):
+            if collector.frames:
+                break
+            await asyncio.sleep(0.01)
+        handler.stop()
+        await receiver
+        queue = handler.subscribers[collector]
+        handler.ring.close()
+        return handler, collector, queue
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_ring_handler_dispatches_and_stops_queues():
+    handler, collector, queue = asyncio.run(dispatch_from_ring())
+    assert collector.frames == [(0x123, 0x12, 1, 42)]
+    assert handler.cache.get((0x124, 0x12, 1)) == 7
+    assert queue._task is None
+    assert not hasattr(handler, "bus_health")
@@ -0,0 +1,61 @@
+import struct
+
+import pytest
+
+from ble.payload import ValueEncoder, value_format
+from canbus.signals import SignalDatabase
+
+DATABASE = {
+    "messages": [
+        {
+            "can_id": "0x200",
+            "length": 2,
+            "signals": [
+                {"name": "coolant", "start": 0, "length": 8, "offset": -40, "unit": "C"},
+                {"name": "pressure", "start": 8, "length": 8, "scale": 0.5, "unit": "kPa"},
+            ],
+        }
+    ]
+}
+
+
+def decode(payload):
+    database = SignalDatabase.from_dict(DATABASE)
+    return database, {key: value for _, _, key, value in database.decode(0x200, payload)}
+
+
+def test_negative_offset_widens_to_signed():
+    database, values = decode(bytes([10, 0]))
+    signal = database.messages[0x200].signals[0]
+
+    assert values[0] == -30
+    assert signal.physical_range() == (-40, 215)
+    fmt = value_format(*signal.physical_range())
+    assert fmt == 'h'
+    assert struct.unpack('<h', ValueEncoder(fmt).payloads(values[0])[0]) == (-30,)
+
+
+def test_scaled_signal_is_float():
+    database, values = decode(bytes([0, 5]))
+    signal = database.messages[0x200].signals[1]
+
+    assert values[1] == 2.5
+    assert value_format(*signal.physical_range(), is_float=True) == 'f'
+    assert struct.unpack('<f', ValueEncoder('f').payloads(values[1])[0]) == (2.5,)
+
+
+def test_value_format_falls_back_to_double_beyond_64_bits():
+    assert value_format(0, 255) == 'B'
+    assert value_format(-1, 255) == 'h'
+    assert value_format(0, 1 << 64) == 'd'
+
+
+def test_signal_encoder():
+    pytest.importorskip("dbus")
+    from ble.signals import signal_encoder
+
+    database, values = decode(bytes([0, 5]))
+    coolant, pressure = database.messages[0x200].signals
+
+    assert signal_encoder(coolant).payloads(-40) == (struct.pack('<h', -40),)
+    assert signal_encoder(pressure).payloads(values[1]) == (struct.pack('<f', 2.5),)